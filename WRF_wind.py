@@ -5,10 +5,48 @@ This module provides functions for processing WRF (Weather Research and Forecast
 specifically for analyzing surface temperature (T2) in relation to wind direction and speed.
 
 Functions:
-    - avg_from_wind(ds, wind_dir, wind_label, WindMin=0, stat='mean'):
+    - avg_from_wind(ds, wind_dir, wind_label, WindMin=0, stat='mean', field='T2', hw_filt=False, block_size=None,
+                    wind=None, hw_pct=95, hw_threshold=None, dtype=None, groupby=None, backend=None):
         Computes average or percentile T2 values for specified wind direction ranges and minimum wind speed thresholds.
-    - get_wrf850UVT(path, mask_range=[-999,0,0,0]):
-        Loads WRF output data from a NetCDF file and optionally applies a spatial mask based on latitude and longitude.
+    - count_wind_days(ds, wind_dir, wind_label, WindMin=0, hw_filt=False, block_size=None, wind=None,
+                      hw_pct=95, hw_threshold=None, dtype=None, groupby=None, backend=None):
+        Counts the samples with wind from each direction range.
+    - heatwave_threshold(ds, hw_pct=95, block_size=None):
+        Per-cell T2 percentile used as heat wave threshold, reusable across runs (hw_threshold=...).
+    - Sectors(wind_dir, boundary='open', resolution=64):
+        Wind direction ranges compiled into a lookup table (any number, widths and overlaps of ranges, at the
+        cost of one table index per sample), with explicit boundary handling; pass it as wind_dir.
+    - WindState(ds, wind_dir, dtype=None):
+        Wind speed and sector index computed once, shared by several of the calls above.
+    - get_wrf850UVT(path, mask_range=[-999,0,0,0], chunks=None, raw_cache=True, workers=8):
+        Loads WRF output data from a NetCDF file and optionally applies a spatial mask based on latitude and longitude
+        (from the memory-mapped raw_cache.py copy of the cropped file when there is one). A glob pattern or
+        list of files is opened in parallel and joined lazily along datetime.
+
+With block_size set, the statistics stream the data in datetime blocks (sums, counts and
+histograms are accumulated block by block), so long records can be processed out of core.
+
+With groupby='month', 'season', 'hour' or 'year', the statistics of every group of
+datetime steps are computed in the same pass (keyed on a combined group and sector index)
+and stacked along a dimension named after the grouping.
+
+Wind directions are reduced to a uint8 sector index, read from the lookup table of the
+Sectors (one index per sample and layer of overlapping ranges, whatever the number of
+ranges), and masks are booleans. With dtype=numpy.float32, U/V/T2 blocks read as float64
+(e.g. from packed files) are cast to float32 before any arithmetic, and the results are
+float32; on float32 data (the WRF files) this gives the same results as the default path.
+Against a float64 computation, means and percentiles agree to float32 rounding (relative 1e-6), except where a sample
+within rounding of a sector boundary or WindMin threshold changes group: the counts of
+those few cells change by one sample, and their means and percentiles by the effect of
+that sample (typically below 0.1 K for a season of 3-hourly T2).
+
+Means and counts are accumulated by the compiled kernel of wind_kernels.py when numba is
+installed (one fused loop over the samples of each grid cell, parallel over the cells),
+else by bincount over whole-array NumPy operations; both give identical results (except for
+winds within rounding of a sector boundary, see wind_kernels.py). The
+HWW_BACKEND environment variable ('auto', 'numba' or 'numpy') sets the default.
+
+The functions are instrumented with profiling.py (off unless HWW_PROFILE is set).
 
 Dependencies:
     - numpy
@@ -17,10 +55,18 @@ Dependencies:
 
 Intended for use in ensemble and heatwave analysis of WRF model outputs.
 """
+import os
+import warnings
+
+import numpy as np
 import xarray
 
+from profiling import profiled, stage
 
-def avg_from_wind(ds, wind_dir, wind_label, WindMin=0, stat='mean', field='T2', hw_filt=False):
+
+@profiled('avg_from_wind')
+def avg_from_wind(ds, wind_dir, wind_label, WindMin=0, stat='mean', field='T2', hw_filt=False, block_size=None,
+                  wind=None, hw_pct=95, hw_threshold=None, dtype=None, groupby=None, backend=None):
     import numpy as np
     import xarray as xr
     import warnings
@@ -31,32 +77,52 @@ def avg_from_wind(ds, wind_dir, wind_label, WindMin=0, stat='mean', field='T2',
 
     Parameters:
         ds (xarray.Dataset): Input dataset containing 'U', 'V', and 'T2' variables, with 'datetime' dimension.
-        wind_dir (array-like): Array of wind direction limits, shape (N, 2). Each row is [start_deg, end_deg].
-                               If start > end, range wraps around 360 degrees.
+        wind_dir (array-like or Sectors): Array of wind direction limits, shape (N, 2). Each row is [start_deg, end_deg].
+                               If start > end, range wraps around 360 degrees. Limits are strict bounds; pass
+                               Sectors(wind_dir, boundary=...) to include them.
         wind_label (list of str): List of labels for each wind direction range, used for output variable names.
-        WindMin (float, optional): Minimum wind speed threshold. Default is 0 (no threshold).
+        WindMin (float or array-like, optional): Minimum wind speed threshold. Default is 0 (no threshold).
+                                                 A list of thresholds, e.g. [0, 1, 2, 5, 10], is computed in the
+                                                 same pass and adds a 'wind_min' dimension to the sector results.
         stat (str or float, optional): 'mean' for mean T2, or a percentile (0-100) for quantile T2. Default is 'mean'.
         field (str, optional): The field to compute statistics on. Default is 'T2'. If 'WSPD', computes wind speed from 'U' and 'V'.
         hw_filt (bool, optional): Heat Wave Filter. If True, filter out data below the 95th percentile of T2 before computing averages. Default is False.
+        hw_pct (float, optional): Percentile of T2 (0-100) used as heat wave threshold with hw_filt. Default is 95.
+        hw_threshold (xarray.DataArray or array-like, optional): Precomputed per-cell T2 threshold (e.g. from
+                                    heatwave_threshold on the historical run, to apply to the future run); implies
+                                    hw_filt and skips the percentile computation. Default is None.
+        block_size (int, optional): Stream the data in blocks of this many datetime steps, so that memory is bounded
+                                    by the block size rather than the record length (use with a lazily opened
+                                    dataset, e.g. get_wrf850UVT(..., chunks=...)). Default is None (in memory).
+        wind (WindState, optional): Wind speed and sector index precomputed with WindState(ds, wind_dir), to share
+                                    between calls on the same data. Default is None (computed here).
+        dtype (numpy dtype, optional): Float type of the computation and of the results, e.g. numpy.float32 to work
+                                       in single precision on float64 data (see the module notes for the tolerance).
+                                       Default is None: the dtype of the data, and float64 percentiles.
+        groupby (str, optional): 'month', 'season', 'hour' or 'year': compute the statistics of each group of datetime
+                                 steps in the same pass, along a dimension of that name (the groups present in the
+                                 data, seasons in the order DJF, MAM, JJA, SON). The heat wave threshold is still taken
+                                 over the whole record. Default is None.
+        backend (str, optional): Engine of the means: 'numba' (compiled kernel), 'numpy', or 'auto' (numba when it
+                                 is installed). With a WindState, its sector index is used by the NumPy engine.
+                                 Default is None: BACKEND (HWW_BACKEND, else 'auto').
     Returns:
         xarray.Dataset: Dataset with T2 averaged (or quantiled) over each wind direction range and over all directions.
 
     Raises:
-        ValueError: If 'stat' is not 'mean' or a float between 0 and 100.
+        ValueError: If 'stat' is not 'mean' or a float between 0 and 100, or groupby is not one of the groupings.
 
     Notes:
         - Wind direction is computed from U and V components.
         - Handles wind direction ranges that wrap around 360 degrees.
-        - Filters out data below WindMin threshold if specified.
+        - Filters out data below WindMin threshold if specified. The '_all' field ignores WindMin.
+        - Means are computed for all sectors in a single pass over the data, in blocks of datetime.
+        - Percentiles are exact (numpy 'linear' method) and returned as float64, or as dtype when given.
     """
 
     # Check the selected field exists in the dataset
-    if field not in ds:
-        if field == 'WSPD':
-            # If WSPD is not in the dataset, compute it from U and V
-            ds['WSPD'] = np.hypot(ds['U'], ds['V'])
-        else:
-            raise ValueError(f"Field '{field}' not found in dataset.")
+    if field not in ds and field != 'WSPD':
+        raise ValueError(f"Field '{field}' not found in dataset.")
 
     # Create an output dataset with coordinates
     ds_out = xr.Dataset(
@@ -66,53 +132,60 @@ def avg_from_wind(ds, wind_dir, wind_label, WindMin=0, stat='mean', field='T2',
         }
     )
 
-    # apply heat wave filter if specified
-    if hw_filt:
-        T2_95 = ds['T2'].quantile(0.95, dim='datetime')
-        ds = ds.where(ds['T2'] > T2_95, drop=True)
+    if wind is not None:
+        wind.check(ds, wind_dir)
+
+    groups, labels = _time_groups(ds, groupby)
 
-    # Compute mean or percentile for the specified field over all directions
-    wind_speed = np.hypot(ds['U'], ds['V'])
+    # heat wave filter: only samples above the T2 threshold are used
+    hw_threshold = _heatwave_mask_threshold(ds, hw_filt, hw_pct, hw_threshold, block_size)
 
     if stat == 'mean':
-        ds_out[field + '_all'] = ds[field].mean(dim='datetime')
-    elif isinstance(stat, (int, float)) and stat >= 0 and stat <= 100:
-        ds_out[field + '_all'] = ds[field].quantile(stat / 100, dim='datetime')
-    else:
+        # Single pass over the data: every sample is assigned to a sector once and
+        # all sector means are accumulated together with grouped (bincount) sums
+        sums, counts, all_sums, all_counts = _sector_sums(ds, wind_dir, field, WindMin, hw_threshold, block_size, wind,
+                                                          dtype, groups, backend)
+        if dtype is None:
+            dtype = (ds[field] if field in ds else ds['U']).dtype
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means, all_means = (sums / counts).astype(dtype), (all_sums / all_counts).astype(dtype)
+        ds_out[field + '_all'] = _grouped([_to_map(ds, field, m) for m in all_means], groupby, labels)
+        for idr in range(wind_dir.shape[0]):
+            ds_out[field + '_' + wind_label[idr]] = _grouped([_to_maps(ds, field, m[:, idr], WindMin) for m in means],
+                                                             groupby, labels)
+        return ds_out
+    elif not (isinstance(stat, (int, float)) and stat >= 0 and stat <= 100):
         raise ValueError("Please set 'stat' to 'mean' or a float percentile between 0 and 100.")
 
-    # get wind direction
-    ds = ds.assign(
-        wind_dir=(180 + np.degrees(np.arctan2(ds['U'], ds['V']))) % 360,
-    )
-
-    # Filter on minimum wind threshold
-    if WindMin > 0:
-        ds = ds.where(wind_speed > WindMin)
-
-    # loop over wind direction ranges
+    # Exact percentiles for all sectors: the samples of each grid column are grouped by
+    # sector once and sorted together, instead of a NaN-aware sort of a masked copy per sector
+    q = stat / 100
+    if block_size is None:
+        quantiles, all_quantiles = _sector_quantiles(ds, wind_dir, field, WindMin, q, hw_threshold, wind, dtype,
+                                                     groups)
+    else:
+        quantiles, all_quantiles = _stream_sector_quantiles(ds, wind_dir, field, WindMin, q, hw_threshold,
+                                                            block_size, wind, dtype, groups)
+    if dtype is not None:
+        quantiles, all_quantiles = quantiles.astype(dtype), all_quantiles.astype(dtype)
+    ds_out[field + '_all'] = _grouped([_to_map(ds, field, a) for a in all_quantiles], groupby,
+                                      labels).assign_coords(quantile=q)
     for idr in range(wind_dir.shape[0]):
-        # Filter on wind direction (note wrap around)
-        wd = ds['wind_dir']
-        if wind_dir[idr][0] > wind_dir[idr][1]:
-            mask = (wd > wind_dir[idr][0]) | (wd < wind_dir[idr][1])
-        else:
-            mask = (wd > wind_dir[idr][0]) & (wd < wind_dir[idr][1])
-
-        ds_filtered = ds.where(mask)
-
-        # Compute mean or percentile for the specified field over time
-        if stat == 'mean':
-            ds_out[field + '_' + wind_label[idr]] = ds_filtered[field].mean(dim='datetime')
-        elif isinstance(stat, (int, float)) and stat >= 0 and stat <= 100:
-            ds_out[field + '_' + wind_label[idr]] = ds_filtered[field].quantile(stat / 100, dim='datetime')
-        else:
-            raise ValueError("Please set 'stat' to 'mean' or a float percentile between 0 and 100.")
+        ds_out[field + '_' + wind_label[idr]] = _grouped([_to_maps(ds, field, a[:, idr], WindMin) for a in quantiles],
+                                                         groupby, labels).assign_coords(quantile=q)
 
     return ds_out
 
-def count_wind_days(ds, wind_dir, wind_label, WindMin=0,hw_filt=False):
-    import numpy as np
+@profiled('count_wind_days')
+def count_wind_days(ds, wind_dir, wind_label, WindMin=0,hw_filt=False, block_size=None, wind=None, hw_pct=95,
+                    hw_threshold=None, dtype=None, groupby=None, backend=None):
+    """
+    Count the samples with wind from each direction range (and above WindMin), per grid cell.
+    Parameters are as in avg_from_wind; with hw_filt or hw_threshold only the heat wave
+    samples (T2 above the threshold) are counted, dtype sets the precision of the wind
+    speed and direction, groupby counts each month/season/hour/year separately and backend
+    selects the counting engine.
+    """
     import xarray as xr
     import warnings
     warnings.filterwarnings("ignore", message="All-NaN slice encountered")
@@ -124,59 +197,932 @@ def count_wind_days(ds, wind_dir, wind_label, WindMin=0,hw_filt=False):
         }
     )
 
+    if wind is not None:
+        wind.check(ds, wind_dir)
+
+    groups, labels = _time_groups(ds, groupby)
+
     # heatwave filter
-    if hw_filt:
-        T2_95 = ds['T2'].quantile(0.95, dim='datetime')
-        ds = ds.where(ds['T2'] > T2_95, drop=True).fillna(0)
+    hw_threshold = _heatwave_mask_threshold(ds, hw_filt, hw_pct, hw_threshold, block_size)
 
+    # Count days with wind from each direction in a single pass
+    _, counts, _, _ = _sector_sums(ds, wind_dir, None, WindMin, hw_threshold, block_size, wind, dtype, groups,
+                                   backend)
+    for idr in range(wind_dir.shape[0]):
+        ds_out['wind_days_' + wind_label[idr]] = _grouped([_to_maps(ds, 'U', c[:, idr], WindMin) for c in counts],
+                                                          groupby, labels)
+    return ds_out
+
+@profiled('heatwave_threshold')
+def heatwave_threshold(ds, hw_pct=95, block_size=None):
     """
-    if WindMin > 0:
-        ds_out['wind_days_all'] = (wind_speed > WindMin).sum(dim='datetime')
-    else:
-        ds_out['wind_days_all'] = wind_speed.notnull().sum(dim='datetime')
-    """
+    Per-cell heat wave threshold: the hw_pct percentile of T2 over 'datetime'.
 
-    wind_speed = np.hypot(ds['U'], ds['V'])
+    Parameters:
+        ds (xarray.Dataset): Dataset with 'T2' and a 'datetime' dimension.
+        hw_pct (float, optional): Percentile (0-100). Default is 95.
+        block_size (int, optional): Stream the data in datetime blocks, as in avg_from_wind. Default is None.
 
-    ds = ds.assign(
-        wind_dir=(180 + np.degrees(np.arctan2(ds['U'], ds['V']))) % 360,
-    )
+    Returns:
+        xarray.DataArray: The threshold over the spatial dimensions of T2, to pass as hw_threshold
+        to avg_from_wind / count_wind_days (e.g. a historical threshold for the future run).
+    """
+    if not (isinstance(hw_pct, (int, float)) and 0 <= hw_pct <= 100):
+        raise ValueError("Please set 'hw_pct' to a float percentile between 0 and 100.")
+    q = hw_pct / 100
+    T2 = ds['T2'].transpose('datetime', ...)
+    if block_size is None:
+        # Cells without data (e.g. masked out) get a NaN threshold, silently
+        with warnings.catch_warnings(), np.errstate(invalid='ignore'):
+            warnings.filterwarnings("ignore", message="All-NaN slice encountered")
+            return T2.quantile(q, dim='datetime').drop_vars('quantile')
 
-    if WindMin > 0:
-        ds = ds.where(wind_speed > WindMin)
+    ncell = T2.size // max(ds.sizes['datetime'], 1)
+    cell = np.arange(ncell)
 
-    for idr in range(wind_dir.shape[0]):
-        wd = ds['wind_dir']
-        if wind_dir[idr][0] > wind_dir[idr][1]:
-            mask = (wd > wind_dir[idr][0]) | (wd < wind_dir[idr][1])
-        else:
-            mask = (wd > wind_dir[idr][0]) & (wd < wind_dir[idr][1])
-        ds_filtered = ds.where(mask)
-
-        # Count days with wind from this direction
-        ds_out['wind_days_' + wind_label[idr]] = ds_filtered['U'].notnull().sum(dim='datetime')
-    return ds_out
+    def sample_keys(sel):
+        values = _block_values(T2, sel)
+        valid = ~np.isnan(values)
+        return np.broadcast_to(cell, values.shape)[valid], values[valid]
+
+    return _to_map(ds, 'T2', _stream_quantile(ds, sample_keys, ncell, q, block_size)).rename('T2')
 
-def get_wrf850UVT(path, mask_range=[-999, 0, 0, 0]):
+@profiled('get_wrf850UVT')
+def get_wrf850UVT(path, mask_range=[-999, 0, 0, 0], chunks=None, raw_cache=True, workers=8):
     """
     Load WRF output data from a NetCDF file and optionally apply a spatial mask.
 
+    If the file and mask_range were converted with raw_cache.convert, and the file has not changed
+    since, the memory-mapped arrays of the cache are opened instead (no decompression).
+
+    A glob pattern or a list of files split along datetime (e.g. one file per year) is opened as one
+    lazy dataset: every file is opened and cropped on its own (in parallel, see _open_files) and the
+    files are joined along datetime without reading or copying their data. Use the result with
+    block_size to stream the statistics over the files.
+
     Parameters:
-        path (str): Path to the NetCDF file containing WRF output.
+        path (str or list of str): Path to the NetCDF file containing WRF output, a glob pattern or a list of paths.
         mask_range (list, optional): List of [lon1, lon2, lat1, lat2] to define a spatial mask.
                                      If mask_range[0] is -999, no mask is applied.
                                      Default is [-999, 0, 0, 0].
+        chunks (int, dict or None, optional): Open the file lazily with dask chunks, e.g. {'datetime': 240},
+                                              for out-of-core statistics with block_size. Default is None
+                                              (one chunk per file for several files).
+        raw_cache (bool, optional): Open the raw_cache entry of the file when there is a fresh one. Default is True.
+        workers (int, optional): Files opened at the same time for several files. Default is 8.
     """
+    import glob
     import xarray as xr
 
-    da = xr.open_dataset(path)
+    if not isinstance(path, (str, os.PathLike)) or glob.has_magic(str(path)):
+        return _open_files(path, mask_range, chunks, raw_cache, workers)
+
+    if raw_cache:
+        import raw_cache as rc
+
+        with stage('open_raw_cache', path=str(path)):
+            da = rc.open_cached(path, mask_range)
+        if da is not None:
+            return da.chunk(chunks) if chunks is not None else da
+
+    with stage('open_dataset', path=str(path)):
+        da = xr.open_dataset(path, chunks=chunks)
 
     if mask_range[0] != -999:
+        # Crop to the south_north/west_east window of the box before any data is read,
+        # then blank the cells of the window that fall outside the box
+        with stage('crop'):
+            indexers, mask = _crop_window(da.XLAT, da.XLONG, mask_range)
+            da = da.isel(indexers)
+            if mask is not None:
+                da = da.where(xr.DataArray(mask, dims=da.XLAT.dims))
+
+    return da
+
+
+@profiled('open_files')
+def _open_files(paths, mask_range, chunks, raw_cache, workers):
+    """
+    Open the WRF files matching a glob pattern (or a list of files) as one dataset along datetime.
+
+    The files are opened lazily with dask chunks (one chunk per file unless chunks is given) by a pool
+    of workers threads, so that the metadata reads of hundreds of files overlap, and cropped one by one
+    with the window of their grid (computed once, see _crop_window). They are ordered by their first
+    datetime and concatenated lazily; the coordinates without datetime (XLAT, XLONG) are those of the
+    first file.
+
+    Raises:
+        FileNotFoundError: If no file matches the pattern.
+        ValueError: If the files are not on the same (cropped) grid.
+    """
+    import glob
+    import xarray as xr
+    from concurrent.futures import ThreadPoolExecutor
+
+    if isinstance(paths, (str, os.PathLike)):
+        pattern = str(paths)
+        paths = sorted(glob.glob(pattern))
+        if not paths:
+            raise FileNotFoundError(f"No WRF file matches '{pattern}'.")
+    paths = list(paths)
+    chunks = {} if chunks is None else chunks
+
+    def open_one(path):
+        return get_wrf850UVT(path, mask_range=mask_range, chunks=chunks, raw_cache=raw_cache)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(paths)))) as pool:
+        parts = list(pool.map(open_one, paths))
+    if len(parts) == 1:
+        return parts[0]
+
+    grid = parts[0].XLAT
+    for path, part in zip(paths[1:], parts[1:]):
+        if part.XLAT.shape != grid.shape or not np.array_equal(part.XLAT.values, grid.values, equal_nan=True):
+            raise ValueError(f"'{path}' is not on the grid of '{paths[0]}'.")
+    parts.sort(key=lambda part: part['datetime'].values[:1].tolist())
+
+    with stage('concat', files=len(parts)):
+        ds = xr.concat(parts, dim='datetime', data_vars='minimal', coords='minimal', compat='override',
+                       join='override', combine_attrs='override')
+    ds.set_close(lambda: [part.close() for part in parts])
+    return ds
+
+
+# Crop windows already computed, by (grid, mask_range)
+_WINDOW_CACHE = {}
+
+
+def _crop_window(XLAT, XLONG, mask_range):
+    """
+    Index window of the grid covering the box mask_range = [lon1, lon2, lat1, lat2].
+
+    The window holds the rows and columns with at least one cell in the box, which is what
+    where(mask, drop=True) keeps. Windows are cached per grid, so files of other models on
+    the same WRF grid skip the search.
+
+    Returns:
+        tuple: (indexers, mask). indexers is a dict for isel over the XLAT dimensions; mask is
+        the boolean mask of the box within the window, or None if every cell is in the box.
+    """
+    import hashlib
+
+    lat, lon = XLAT.values, XLONG.values
+    key = (XLAT.dims, lat.shape, hashlib.sha1(lat.tobytes() + lon.tobytes()).hexdigest(),
+           tuple(float(m) for m in mask_range))
+    if key not in _WINDOW_CACHE:
         lon1, lon2, lat1, lat2 = mask_range
-        mask = (
-                (da.XLAT >= lat1) & (da.XLAT <= lat2) &
-                (da.XLONG >= lon1) & (da.XLONG <= lon2)
-        )
-        da = da.where(mask, drop=True)
+        mask = (lat >= lat1) & (lat <= lat2) & (lon >= lon1) & (lon <= lon2)
+        indexers = {}
+        for axis, dim in enumerate(XLAT.dims):
+            keep = np.nonzero(mask.any(axis=1 - axis))[0]
+            if keep.size and keep[-1] - keep[0] + 1 == keep.size:
+                keep = slice(int(keep[0]), int(keep[-1]) + 1)
+            indexers[dim] = keep
+        mask = mask[np.ix_(*(np.arange(n)[indexers[dim]] for n, dim in zip(mask.shape, XLAT.dims)))]
+        _WINDOW_CACHE[key] = (indexers, None if mask.all() else mask)
+    return _WINDOW_CACHE[key]
+
+
+# Number of samples (datetime x grid cells) handled per block in the sector reductions.
+# Bounds the size of the temporaries independently of the record length and sector count.
+_BLOCK_SAMPLES = 2 ** 22
+
+
+def _wind_direction(U, V):
+    """Direction the wind is blowing from, in degrees [0, 360)."""
+    return (180 + np.degrees(np.arctan2(U, V))) % 360
+
+
+# Boundary handling of the sector limits [start, end]: start included?, end included?
+_BOUNDARIES = {'open': (False, False), 'left': (True, False), 'right': (False, True), 'closed': (True, True)}
+
+# Compiled Sectors of plain wind_dir arrays, by limits
+_SECTORS_CACHE = {}
+
+
+class Sectors:
+    """
+    Wind direction sectors compiled into lookup tables over quantised direction, so that assigning
+    a sample to its sector costs one table index whatever the number of sectors.
+
+    Pass a Sectors as wind_dir to avoid recompiling it and to choose the boundary handling; a plain
+    (N, 2) array is compiled with the default (strict) boundaries, as the sectors have always been.
+
+    The direction d in [0, 360) is scaled by resolution (a power of 2, so exactly) and keyed on the
+    2 * 360 * resolution entries "d exactly on step k" and "d strictly between steps k and k + 1"
+    (plus 360 and NaN): for limits on the steps every entry is entirely inside or outside each
+    sector, so the lookup gives the same sectors as comparing d with the limits. Limits off the steps (e.g. 33.3) are
+    compared directly instead (table is None).
+
+    Parameters:
+        wind_dir (array-like): Wind direction ranges [start, end] in degrees, shape (N, 2); if start > end the
+                               range wraps around 360. Any widths, and overlapping ranges, are allowed.
+        boundary (str, optional): Which limits belong to the range: 'open' (start < d < end, the default, which
+                                  leaves directions exactly on a limit, e.g. 90, out of both neighbours), 'left'
+                                  (start <= d < end: adjacent ranges partition the circle), 'right'
+                                  (start < d <= end) or 'closed' (start <= d <= end).
+        resolution (int, optional): Table steps per degree, a power of 2. Default is 64 (1/64 degree).
+
+    Attributes:
+        limits (numpy.ndarray): The ranges, float64 (N, 2).
+        layers (list of list of int): Groups of ranges without common directions; a sample falls in at most one
+                                      range per layer (a single layer for quadrants or roses).
+        table (numpy.ndarray or None): Sector index of every entry, one row per layer, N for no sector.
+    """
+
+    def __init__(self, wind_dir, boundary='open', resolution=64):
+        if boundary not in _BOUNDARIES:
+            raise ValueError(f"Please set 'boundary' to one of {tuple(_BOUNDARIES)}.")
+        if not (isinstance(resolution, (int, np.integer)) and resolution > 0 and resolution & (resolution - 1) == 0):
+            raise ValueError("Please set 'resolution' to a power of 2.")
+        self.limits = np.array(wind_dir, dtype=float).reshape(-1, 2)
+        self.boundary = boundary
+        self.resolution = int(resolution)
+
+        nsec = self.limits.shape[0]
+        steps = 360 * self.resolution
+        # A direction exactly on every step and one strictly between every two steps, then 360 (which
+        # float32 rounding can produce)
+        probes = np.empty(2 * steps + 1)
+        probes[0::2] = np.arange(steps + 1) / self.resolution
+        probes[1::2] = (np.arange(steps) + 0.5) / self.resolution
+        member = np.array([self._inside(probes, idr) for idr in range(nsec)], dtype=bool).reshape(nsec, probes.size)
+
+        self.layers = []
+        for idr in range(nsec):
+            for layer in self.layers:
+                if not member[layer].any(axis=0)[member[idr]].any():
+                    layer.append(idr)
+                    break
+            else:
+                self.layers.append([idr])
+
+        self.table = None
+        if np.array_equal(self.limits * self.resolution, np.round(self.limits * self.resolution)):
+            self.table = np.full((len(self.layers), 2 * steps + 2), nsec, dtype=_index_dtype(nsec))
+            for row, layer in zip(self.table, self.layers):
+                for idr in layer:
+                    row[:-1][member[idr]] = idr
+
+    @property
+    def shape(self):
+        return self.limits.shape
+
+    def __len__(self):
+        return self.limits.shape[0]
+
+    def __getitem__(self, item):
+        return self.limits[item]
+
+    def __array__(self, dtype=None, copy=None):
+        return self.limits if dtype is None else self.limits.astype(dtype)
+
+    def __repr__(self):
+        return f"Sectors({self.limits.tolist()}, boundary='{self.boundary}', resolution={self.resolution})"
+
+    def __eq__(self, other):
+        return (isinstance(other, Sectors) and np.array_equal(self.limits, other.limits)
+                and (self.boundary, self.resolution) == (other.boundary, other.resolution))
+
+    def _inside(self, direction, idr):
+        """Mask of the directions in range idr, by comparison with its limits."""
+        lo, hi = self.limits[idr]
+        with_lo, with_hi = _BOUNDARIES[self.boundary]
+        above = direction >= lo if with_lo else direction > lo
+        below = direction <= hi if with_hi else direction < hi
+        return (above | below) if lo > hi else (above & below)
+
+    def key(self, direction):
+        """Table entry of each direction (the last entry for NaN)."""
+        scaled = direction * self.resolution
+        key = np.floor(scaled)
+        between = scaled > key
+        key *= 2
+        key += between
+        np.fmin(key, 2 * 360 * self.resolution + 1, out=key)
+        return key.astype(np.intp)
+
+    def index(self, direction):
+        """
+        Sector index of each direction, one array per layer (N for no sector or a NaN direction).
+        """
+        nsec = self.limits.shape[0]
+        if self.table is not None:
+            key = self.key(direction)
+            return [row[key] for row in self.table]
+
+        indexes = []
+        for layer in self.layers:
+            index = np.full(direction.shape, nsec, dtype=_index_dtype(nsec))
+            for idr in layer:
+                index[self._inside(direction, idr)] = idr
+            indexes.append(index)
+        return indexes
+
+
+def _sectors(wind_dir):
+    """wind_dir as Sectors (compiled with the default boundaries, once per limits, if it is an array)."""
+    if isinstance(wind_dir, Sectors):
+        return wind_dir
+    limits = np.array(wind_dir, dtype=float)
+    cache_key = (limits.shape, limits.tobytes())
+    if cache_key not in _SECTORS_CACHE:
+        _SECTORS_CACHE[cache_key] = Sectors(limits)
+    return _SECTORS_CACHE[cache_key]
+
+
+def _sector_layers(wind_dir):
+    """
+    Group the rows of wind_dir into layers of non-overlapping direction ranges, so that each
+    sample falls in at most one sector per layer. Ordinary quadrants or roses give one layer.
+    """
+    return _sectors(wind_dir).layers
+
+
+def _index_dtype(nsec):
+    """Smallest unsigned integer type holding the sector indices 0..nsec."""
+    return np.uint8 if nsec < 255 else np.uint16 if nsec < 65535 else np.uint32
+
+
+class WindState:
+    """
+    Wind speed and sector index of a dataset, computed once and shared by avg_from_wind and
+    count_wind_days calls (pass it as wind=...) on the same data, e.g. for several fields,
+    WindMin values or heat wave settings.
+
+    Parameters:
+        ds (xarray.Dataset): Dataset with 'U' and 'V', with a 'datetime' dimension.
+        wind_dir (array-like or Sectors): Wind direction ranges, shape (N, 2), as in avg_from_wind.
+        dtype (numpy dtype, optional): Float type U and V are cast to, e.g. numpy.float32. Default is None (as U).
+
+    Attributes:
+        wind_dir (numpy.ndarray): The wind direction ranges.
+        speed (xarray.DataArray): Wind speed, in the dtype of U (or dtype).
+        sector (list of xarray.DataArray): Sector index of every sample as uint8, one array per layer of
+                                           non-overlapping ranges (a single one for quadrants or roses).
+                                           N marks samples outside every range.
+    """
+
+    @profiled('WindState')
+    def __init__(self, ds, wind_dir, dtype=None):
+        self.sectors = _sectors(wind_dir)
+        self.wind_dir = self.sectors.limits
+        self.layers = self.sectors.layers
+        U = ds['U'].transpose('datetime', ...)
+        V = ds['V'].transpose(*U.dims)
+        u, v = U.values, V.values
+        if dtype is not None:
+            u, v = u.astype(dtype, copy=False), v.astype(dtype, copy=False)
+        self.speed = xarray.DataArray(np.hypot(u, v), dims=U.dims)
+        direction = _wind_direction(u, v)
+        self.sector = [xarray.DataArray(index, dims=U.dims) for index in self.sectors.index(direction)]
+
+    def check(self, ds, wind_dir):
+        """Raise ValueError unless this state was computed for the shape of ds and for wind_dir."""
+        if self.speed.sizes != ds['U'].sizes or _sectors(wind_dir) != self.sectors:
+            raise ValueError("The WindState was computed for another dataset or other wind_dir ranges.")
+
+
+# Groupings of the datetime steps, and the order of the seasons
+_GROUPBY = ('month', 'season', 'hour', 'year')
+_SEASONS = ['DJF', 'MAM', 'JJA', 'SON']
+
+
+def _time_groups(ds, groupby):
+    """
+    Group of every datetime step for groupby (one of _GROUPBY, or None for a single group).
+
+    Returns:
+        tuple: (groups, labels). groups is (codes, ngroups) with the group code of every step, or None
+        without groupby; labels are the group labels, in code order.
+    """
+    if groupby is None:
+        return None, None
+    if groupby not in _GROUPBY:
+        raise ValueError(f"Please set 'groupby' to None or one of {_GROUPBY}.")
+    if 'datetime' not in ds.coords or not np.issubdtype(ds['datetime'].dtype, np.datetime64):
+        raise ValueError("groupby needs a 'datetime' coordinate of dates.")
+
+    present, codes = np.unique(getattr(ds['datetime'].dt, groupby).values, return_inverse=True)
+    labels = present
+    if groupby == 'season':
+        # Calendar order rather than alphabetical
+        labels = np.array([season for season in _SEASONS if season in present])
+        codes = np.array([list(labels).index(season) for season in present])[codes]
+    return (codes.astype(np.intp).ravel(), labels.size), labels
+
+
+def _block_groups(groups, sel):
+    """Group codes of the datetime steps of one block (all steps if sel has no datetime indexer)."""
+    codes, _ = groups
+    return codes[sel['datetime']] if 'datetime' in sel else codes
+
 
-    return da
\ No newline at end of file
+def _time_blocks(ds, block_size=None):
+    """Yield isel indexers of datetime blocks of block_size steps (default: about _BLOCK_SAMPLES samples)."""
+    nt = ds.sizes['datetime']
+    step = block_size or max(1, _BLOCK_SAMPLES * nt // max(ds['U'].size, 1))
+    for t0 in range(0, nt, step):
+        yield {'datetime': slice(t0, t0 + step)}
+
+
+def _space_blocks(ds):
+    """Yield isel indexers of blocks of the first spatial dimension, all times, of about _BLOCK_SAMPLES samples."""
+    dim = ds['U'].transpose('datetime', ...).dims[1]
+    n = ds.sizes[dim]
+    step = max(1, _BLOCK_SAMPLES * n // max(ds['U'].size, 1))
+    for i0 in range(0, n, step):
+        yield {dim: slice(i0, i0 + step)}
+
+
+def _block_values(da, sel, dtype=None):
+    """Load one block (isel indexers sel) of a variable as a (time, grid cell) array, cast to dtype if given."""
+    da = da.transpose('datetime', ...).isel({dim: sel[dim] for dim in sel if dim in da.dims})
+    values = da.values.reshape(da.shape[0], -1)
+    return values if dtype is None else values.astype(dtype, copy=False)
+
+
+def _block_threshold(hw_threshold, sel):
+    """The heat wave threshold of the grid cells of one block, flattened."""
+    return hw_threshold.isel({dim: sel[dim] for dim in sel if dim in hw_threshold.dims}).values.ravel()
+
+
+def _block_samples(ds, sel, field, hw_threshold, wind_dir, wind=None, dtype=None):
+    """
+    Load one block of the data as (time, grid cell) arrays, with the float variables cast to dtype if given.
+
+    Returns:
+        tuple: (values, valid, speed, sectors). values is the field (None if field is None),
+        valid the mask of usable samples (field not NaN and, with a heat wave threshold, T2
+        above it), speed the wind speed and sectors the sector index of each layer, taken
+        from the WindState when one is given.
+    """
+    if wind is not None:
+        speed = _block_values(wind.speed, sel, dtype)
+        sectors = [_block_values(index, sel) for index in wind.sector]
+    else:
+        u = _block_values(ds['U'], sel, dtype)
+        v = _block_values(ds['V'], sel, dtype)
+        speed = np.hypot(u, v)
+        direction = _wind_direction(u, v)
+        sectors = _sectors(wind_dir).index(direction)
+
+    if field is None:
+        values, valid = None, np.ones(speed.shape, dtype=bool)
+    else:
+        values = speed if field not in ds else _block_values(ds[field], sel, dtype)
+        valid = ~np.isnan(values)
+    if hw_threshold is not None:
+        T2 = values if field == 'T2' else _block_values(ds['T2'], sel, dtype)
+        valid &= T2 > _block_threshold(hw_threshold, sel)
+    return values, valid, speed, sectors
+
+
+def _wind_min_levels(WindMin):
+    """WindMin as a 1-D array of thresholds; a threshold <= 0 keeps every sample, as WindMin=0 always has."""
+    wind_min = np.atleast_1d(np.asarray(WindMin, dtype=float))
+    if wind_min.ndim != 1:
+        raise ValueError("Please set 'WindMin' to a number or a 1-D list of numbers.")
+    return np.where(wind_min > 0, wind_min, -np.inf)
+
+
+def _speed_bins(speed, levels):
+    """
+    Number of the (sorted) WindMin levels each wind speed is above: a sample passes
+    threshold levels[j] exactly when j < bin. NaN speeds only pass the levels <= 0.
+    """
+    bins = np.searchsorted(levels, speed, side='left')
+    bins[np.isnan(speed)] = np.count_nonzero(np.isneginf(levels))
+    return bins
+
+
+# Default engine of the sector sums: 'auto' (numba when installed), 'numba' or 'numpy'
+BACKEND = os.environ.get('HWW_BACKEND', 'auto')
+_BACKENDS = ('auto', 'numba', 'numpy')
+
+
+def _use_kernel(backend):
+    """
+    True if the sector sums use the compiled kernel of wind_kernels.py: backend (BACKEND if None)
+    is 'numba', or 'auto' and numba is installed.
+    """
+    backend = BACKEND if backend is None else backend
+    if backend not in _BACKENDS:
+        raise ValueError(f"Please set 'backend' to one of {_BACKENDS}.")
+    if backend == 'numpy':
+        return False
+    import wind_kernels
+
+    if backend == 'numba' and not wind_kernels.available():
+        raise ImportError("backend='numba' needs numba to be installed.")
+    return wind_kernels.available()
+
+
+def _kernel_block(ds, sel, field, hw_threshold, wind_dir, levels, dtype, groups, sums, counts, all_sums, all_counts):
+    """Add the sums and counts of one datetime block to the flat totals of _sector_sums with the compiled kernel."""
+    import wind_kernels
+
+    u = _block_values(ds['U'], sel, dtype)
+    v = _block_values(ds['V'], sel, dtype)
+    if field is None:
+        mode, values = wind_kernels.COUNT, u
+    elif field not in ds:
+        mode, values = wind_kernels.SPEED, u
+    else:
+        mode, values = wind_kernels.FIELD, _block_values(ds[field], sel, dtype)
+    ncell = u.shape[1]
+    if hw_threshold is None:
+        T2, threshold = u, np.zeros(ncell)
+    else:
+        T2 = values if field == 'T2' else _block_values(ds['T2'], sel, dtype)
+        threshold = _block_threshold(hw_threshold, sel).astype(np.float64)
+    group = np.zeros(u.shape[0], dtype=np.intp) if groups is None else _block_groups(groups, sel)
+    # The constants of _wind_direction in the dtype of the data, so the directions are those of NumPy
+    consts = np.array([np.degrees(np.ones(1, dtype=u.dtype))[0], 180, 360], dtype=u.dtype)
+    sectors = _sectors(wind_dir)
+    wind_kernels.sector_sums(u, v, values, T2, threshold, mode, hw_threshold is not None, sectors.table,
+                             float(sectors.resolution), levels, group, consts,
+                             sums.reshape(-1, ncell), counts.reshape(-1, ncell), all_sums.reshape(-1, ncell),
+                             all_counts.reshape(-1, ncell))
+
+
+@profiled('sector_sums')
+def _sector_sums(ds, wind_dir, field, WindMin, hw_threshold=None, block_size=None, wind=None, dtype=None,
+                 groups=None, backend=None):
+    """
+    Accumulate per-sector sums and sample counts of a field for every grid cell in one
+    pass over the data, using a grouped (bincount) reduction keyed on speed bin, sector
+    and cell. Only one datetime block is held in memory at a time.
+
+    Several WindMin thresholds cost one pass: the samples are binned by how many of the
+    thresholds their speed exceeds, and the sums for a threshold are the cumulative sums
+    of the bins above it.
+
+    Parameters:
+        ds (xarray.Dataset): Dataset with 'U', 'V' and the field, with a 'datetime' dimension.
+        wind_dir (array-like): Wind direction ranges, shape (N, 2), as in avg_from_wind.
+        field (str or None): Field to sum. If None, only count samples with valid U.
+        WindMin (float or array-like): Minimum wind speed threshold(s) for the sector sums.
+        hw_threshold (xarray.DataArray, optional): T2 heat wave threshold per grid cell; only samples above it are used.
+        block_size (int, optional): Datetime steps per block.
+        wind (WindState, optional): Precomputed wind speed and sector index.
+        dtype (numpy dtype, optional): Float type the data blocks are cast to.
+        groups (tuple, optional): (codes, G) group code of every datetime step (from _time_groups).
+        backend (str, optional): 'auto', 'numba' or 'numpy' (see _use_kernel). Default is BACKEND.
+
+    Returns:
+        tuple: (sums, counts, all_sums, all_counts). sums and counts have shape (G, M, N, ncell)
+        for the G groups (1 without groups) and M WindMin thresholds, all_sums and all_counts
+        (G, ncell) hold the field over all directions without the WindMin threshold.
+    """
+    nsec = wind_dir.shape[0]
+    ncell = ds['U'].size // max(ds.sizes['datetime'], 1)
+    cell = np.arange(ncell)
+    wind_min = _wind_min_levels(WindMin)
+    order = np.argsort(wind_min, kind='stable')
+    levels = wind_min[order]
+    ngroups = 1 if groups is None else groups[1]
+    size = ngroups * (levels.size + 1) * (nsec + 1) * ncell
+
+    sums = np.zeros(size)
+    counts = np.zeros(size, dtype=np.int64)
+    all_sums = np.zeros(ngroups * ncell)
+    all_counts = np.zeros(ngroups * ncell, dtype=np.int64)
+
+    kernel = wind is None and _sectors(wind_dir).table is not None and _use_kernel(backend)
+    for sel in _time_blocks(ds, block_size):
+        if kernel:
+            _kernel_block(ds, sel, field, hw_threshold, wind_dir, levels, dtype, groups, sums, counts, all_sums,
+                          all_counts)
+            continue
+        values, valid, speed, sectors = _block_samples(ds, sel, field, hw_threshold, wind_dir, wind, dtype)
+        # Key offset of the group of every sample, (time, 1)
+        group = None if groups is None else _block_groups(groups, sel)[:, None]
+
+        if values is not None:
+            if group is None:
+                all_sums += values.sum(axis=0, where=valid, dtype=np.float64)
+                all_counts += valid.sum(axis=0)
+            else:
+                key = (group * ncell + cell)[valid]
+                all_sums += np.bincount(key, weights=values[valid], minlength=all_sums.size)
+                all_counts += np.bincount(key, minlength=all_counts.size)
+
+        bins = _speed_bins(speed, levels).astype(np.intp) * ((nsec + 1) * ncell)
+        if group is not None:
+            bins += group * ((levels.size + 1) * (nsec + 1) * ncell)
+        for index in sectors:
+            key = (bins + index.astype(np.intp) * ncell + cell)[valid]
+            counts += np.bincount(key, minlength=counts.size)
+            if values is not None:
+                sums += np.bincount(key, weights=values[valid], minlength=sums.size)
+
+    # Threshold levels[j] keeps the samples of bins j+1 and up
+    def passed(totals):
+        totals = np.cumsum(totals.reshape(ngroups, levels.size + 1, nsec + 1, ncell)[:, ::-1],
+                           axis=1)[:, ::-1][:, 1:, :nsec]
+        out = np.empty_like(totals)
+        out[:, order] = totals
+        return out
+
+    return passed(sums), passed(counts), all_sums.reshape(ngroups, ncell), all_counts.reshape(ngroups, ncell)
+
+
+def _interpolate(a, b, t):
+    """Linear interpolation between the order statistics a and b, exactly as numpy.quantile does it."""
+    diff = b - a
+    return np.where(t >= 0.5, b - diff * (1 - t), a + diff * t)
+
+
+def _quantile_ranks(counts, q):
+    """Ranks of the two order statistics and the weight between them for quantile q of counts samples."""
+    virtual = (counts - 1) * np.float64(q)
+    lo = np.floor(virtual).astype(np.intp)
+    hi = np.minimum(lo + 1, counts - 1)
+    return lo, hi, virtual - lo
+
+
+def _select_quantile(sorted_values, start, counts, q):
+    """
+    Linearly interpolated quantile q of each row of sorted_values, using the counts[c]
+    values from position start[c]. Matches numpy.quantile (method='linear') bit for bit.
+    Empty rows give NaN.
+    """
+    out = np.full(counts.shape, np.nan)
+    has = np.nonzero(counts > 0)[0]
+    lo, hi, t = _quantile_ranks(counts[has], q)
+    out[has] = _interpolate(sorted_values[has, start[has] + lo], sorted_values[has, start[has] + hi], t)
+    return out
+
+
+def _partition_quantiles(sorted_values, order, index, nparts, q):
+    """
+    Quantile q of each part of each row of sorted_values, where index (unsorted, same shape)
+    gives the part of every sample and order sorts each row by value. Samples with
+    index == nparts are ignored.
+
+    Returns:
+        numpy.ndarray: Shape (nparts, nrows).
+    """
+    nrows = index.shape[0]
+    index = np.take_along_axis(index, order, axis=1)
+
+    # Partition each row by part, keeping the value order within each part
+    grouped = np.take_along_axis(sorted_values, np.argsort(index, axis=1, kind='stable'), axis=1)
+    counts = np.bincount((index + np.arange(nrows)[:, None] * (nparts + 1)).ravel(),
+                         minlength=nrows * (nparts + 1)).reshape(nrows, nparts + 1).T
+    start = np.cumsum(counts, axis=0) - counts
+    return np.stack([_select_quantile(grouped, start[i], counts[i], q) for i in range(nparts)])
+
+
+@profiled('sector_quantiles')
+def _sector_quantiles(ds, wind_dir, field, WindMin, q, hw_threshold=None, wind=None, dtype=None, groups=None):
+    """
+    Exact quantile q of a field per sector and grid cell, without masked copies of the data.
+
+    The grid is processed in blocks of columns. Each column's samples are sorted by value
+    once, then partitioned by sector with a stable radix sort on the (uint8) sector index,
+    so every sector's samples end up contiguous and in order and each quantile is read off
+    by index. The cost does not grow with the number of sectors, and every WindMin
+    threshold reuses the same sort. With groups, the parts are the (group, sector) pairs.
+
+    Returns:
+        tuple: (quantiles, all_quantiles) with shapes (G, M, N, ncell) for the G groups
+        (1 without groups) and M WindMin thresholds, and (G, ncell).
+    """
+    nsec = wind_dir.shape[0]
+    layers = _sector_layers(wind_dir)
+    wind_min = _wind_min_levels(WindMin)
+    ngroups = 1 if groups is None else groups[1]
+    group = 0 if groups is None else groups[0]
+    quantiles, all_quantiles = [], []
+
+    for sel in _space_blocks(ds):
+        # Work on (grid cell, time) arrays so each column's samples are contiguous
+        values, valid, speed, sectors = _block_samples(ds, sel, field, hw_threshold, wind_dir, wind, dtype)
+        values, valid, speed = np.ascontiguousarray(values.T), valid.T, speed.T
+
+        # Sort each column once (NaN last); this order is shared by all sectors
+        order = np.argsort(values, axis=1)
+        sorted_values = np.take_along_axis(values, order, axis=1)
+        index = np.where(valid, group, ngroups).astype(_index_dtype(ngroups))
+        all_quantiles.append(_partition_quantiles(sorted_values, order, index, ngroups, q))
+
+        nparts = ngroups * nsec
+        result = np.full((ngroups, wind_min.size, nsec, values.shape[0]), np.nan)
+        for j, level in enumerate(wind_min):
+            use = valid & (speed > level) if level > -np.inf else valid
+            for layer, index in zip(layers, sectors):
+                index = np.where(use & (index.T < nsec), group * nsec + index.T, nparts).astype(_index_dtype(nparts))
+                parts = _partition_quantiles(sorted_values, order, index, nparts, q).reshape(ngroups, nsec, -1)
+                result[:, j, layer] = parts[:, layer]
+        quantiles.append(result)
+
+    return np.concatenate(quantiles, axis=3), np.concatenate(all_quantiles, axis=1)
+
+
+# Streaming quantiles: histogram bins per refinement pass, and the number of samples
+# per order statistic below which they are collected and sorted directly
+_HIST_BINS = 64
+_HIST_SAMPLES = 64
+
+
+def _bin_edge(left, right, k):
+    """Edge k of _HIST_BINS equal bins over [left, right)."""
+    return np.where(k >= _HIST_BINS, right, left + k * ((right - left) / _HIST_BINS))
+
+
+def _bin_index(values, left, right):
+    """Bin of each value in [left, right), consistent with _bin_edge."""
+    k = np.clip(np.floor((values - left) / ((right - left) / _HIST_BINS)), 0, _HIST_BINS - 1).astype(np.intp)
+    # Move the values outside their estimated bin; by more than one bin only where edges coincide
+    # (intervals a few float64 steps wide)
+    i = np.nonzero(values < _bin_edge(left, right, k))[0]
+    while i.size:
+        k[i] -= 1
+        i = i[values[i] < _bin_edge(left[i], right[i], k[i])]
+    i = np.nonzero(values >= _bin_edge(left, right, k + 1))[0]
+    while i.size:
+        k[i] += 1
+        i = i[values[i] >= _bin_edge(left[i], right[i], k[i] + 1)]
+    return k
+
+
+def _splittable(left, right, dtype):
+    """True where [left, right) can hold more than one value of dtype (spacing at the bound nearest zero)."""
+    return right - left > np.spacing(np.minimum(np.abs(left), np.abs(right)).astype(dtype))
+
+
+def _stream_quantile(ds, sample_keys, ngroups, q, block_size):
+    """
+    Exact quantile q for groups of samples streamed in datetime blocks.
+
+    sample_keys(sel) returns (keys, values) for the usable samples of the datetime block sel, with
+    integer group keys in [0, ngroups). The passes over the blocks are:
+        1. sample counts per group and the range of the values,
+        2. histograms of _HIST_BINS bins per order statistic needed by the quantile (two per
+           group), each pass narrowing the value interval that holds it, until the interval
+           holds at most _HIST_SAMPLES samples (or a single value),
+        3. the samples left in each interval are collected and sorted to pick the exact value.
+    Memory is bounded by the block size and the histograms, not by the record length.
+
+    Returns:
+        numpy.ndarray: Quantile per group (NaN for empty groups), shape (ngroups,).
+    """
+    counts = np.zeros(ngroups, dtype=np.int64)
+    vmin, vmax, dtype = np.inf, -np.inf, None
+    for sel in _time_blocks(ds, block_size):
+        keys, values = sample_keys(sel)
+        counts += np.bincount(keys, minlength=ngroups)
+        dtype = values.dtype
+        if values.size:
+            vmin, vmax = min(vmin, float(values.min())), max(vmax, float(values.max()))
+
+    out = np.full(ngroups, np.nan)
+    has = np.nonzero(counts > 0)[0]
+    if has.size == 0:
+        return out
+
+    # Order statistics ("targets") wanted: rank lo then rank hi of every non-empty group,
+    # each with the interval of values known to hold it and its rank within that interval
+    lo, hi, t = _quantile_ranks(counts[has], q)
+    ntarget = 2 * has.size
+    first = np.full(ngroups, -1)
+    first[has] = np.arange(has.size)
+    rank = np.concatenate([lo, hi])
+    left = np.full(ntarget, vmin)
+    right = np.full(ntarget, np.nextafter(vmax, np.inf))
+    count = np.concatenate([counts[has], counts[has]])
+
+    def targets(keys, values, wanted):
+        # (target, value) pairs of the samples of the wanted targets that fall in their
+        # intervals, in pieces of 2**20 samples to bound the float64 temporaries
+        for i0 in range(0, keys.size, 2 ** 20):
+            piece = slice(i0, i0 + 2 ** 20)
+            for target in (first[keys[piece]], first[keys[piece]] + has.size):
+                sel = wanted[target]
+                target, values_sel = target[sel], values[piece][sel]
+                sel = (values_sel >= left[target]) & (values_sel < right[target])
+                yield target[sel], values_sel[sel]
+
+    active = (count > _HIST_SAMPLES) & _splittable(left, right, dtype)
+    while active.any():
+        hist = np.zeros(ntarget * _HIST_BINS, dtype=np.int32)
+        for sel in _time_blocks(ds, block_size):
+            index = np.concatenate([(target * _HIST_BINS + _bin_index(values, left[target], right[target]))
+                                    .astype(np.int32 if hist.size < 2 ** 31 else np.int64)
+                                    for target, values in targets(*sample_keys(sel), active)])
+            np.add(hist, np.bincount(index, minlength=hist.size), out=hist, casting='unsafe')
+
+        # Narrow each active target to the bin holding its rank
+        cum = np.cumsum(hist.reshape(ntarget, _HIST_BINS)[active], axis=1, dtype=np.int64)
+        rows = np.arange(cum.shape[0])
+        k = (cum <= rank[active][:, None]).sum(axis=1)
+        below = np.where(k > 0, cum[rows, np.maximum(k - 1, 0)], 0)
+        l, r = left[active], right[active]
+        left[active], right[active] = _bin_edge(l, r, k), _bin_edge(l, r, k + 1)
+        rank[active] -= below
+        count[active] = cum[rows, k] - below
+        active &= (count > _HIST_SAMPLES) & _splittable(left, right, dtype)
+
+    # Collect the remaining samples; an interval too narrow to split holds copies of one value
+    few = count <= _HIST_SAMPLES
+    single = np.full(ntarget, np.inf)
+    cand_targets, cand_values = [], []
+    for sel in _time_blocks(ds, block_size):
+        for target, values in targets(*sample_keys(sel), np.ones(ntarget, dtype=bool)):
+            sel = few[target]
+            cand_targets.append(target[sel])
+            cand_values.append(values[sel])
+            np.minimum.at(single, target[~sel], values[~sel])
+    target = np.concatenate(cand_targets)
+    values = np.concatenate(cand_values)
+    picked = single
+    if values.size:
+        values = values[np.lexsort((values, target))]
+        ncand = np.bincount(target, minlength=ntarget)
+        start = np.cumsum(ncand) - ncand
+        picked = np.where(few, values[np.minimum(start + rank, values.size - 1)], single)
+    picked = picked.astype(dtype)
+
+    out[has] = _interpolate(picked[:has.size], picked[has.size:], t)
+    return out
+
+
+@profiled('stream_sector_quantiles')
+def _stream_sector_quantiles(ds, wind_dir, field, WindMin, q, hw_threshold, block_size, wind=None, dtype=None,
+                             groups=None):
+    """
+    Exact quantile q of a field per sector and grid cell, reading the data in datetime blocks.
+    Same results as _sector_quantiles.
+
+    Returns:
+        tuple: (quantiles, all_quantiles) with shapes (G, M, N, ncell) for the G groups
+        (1 without groups) and M WindMin thresholds, and (G, ncell).
+    """
+    nsec = wind_dir.shape[0]
+    ncell = ds['U'].size // max(ds.sizes['datetime'], 1)
+    cell = np.arange(ncell)
+    wind_min = _wind_min_levels(WindMin)
+    ngroups = 1 if groups is None else groups[1]
+
+    def sample_keys(sel):
+        # Group keys: ncell * group + cell for all directions, then
+        # ncell * (G + nsec * (M * group + threshold) + sector) + cell for the sectors
+        values, valid, speed, sectors = _block_samples(ds, sel, field, hw_threshold, wind_dir, wind, dtype)
+        group = 0 if groups is None else _block_groups(groups, sel)[:, None]
+        keys = [np.broadcast_to(group * ncell + cell, values.shape)[valid]]
+        samples = [values[valid]]
+        for j, level in enumerate(wind_min):
+            use = valid & (speed > level) if level > -np.inf else valid
+            for index in sectors:
+                in_sector = use & (index < nsec)
+                part = ngroups + nsec * (wind_min.size * group + j) + index.astype(np.intp)
+                keys.append((part * ncell + cell)[in_sector])
+                samples.append(values[in_sector])
+        return np.concatenate(keys), np.concatenate(samples)
+
+    result = _stream_quantile(ds, sample_keys, ngroups * (1 + wind_min.size * nsec) * ncell, q, block_size)
+    return (result[ngroups * ncell:].reshape(ngroups, wind_min.size, nsec, ncell),
+            result[:ngroups * ncell].reshape(ngroups, ncell))
+
+
+def _heatwave_mask_threshold(ds, hw_filt, hw_pct, hw_threshold, block_size):
+    """
+    The T2 threshold the engines mask samples with (None without heat wave filter): hw_threshold
+    when given, as a DataArray over the spatial dimensions of T2, else heatwave_threshold(ds, hw_pct).
+    """
+    if hw_threshold is None:
+        return heatwave_threshold(ds, hw_pct, block_size) if hw_filt else None
+
+    dims = ds['T2'].transpose('datetime', ...).dims[1:]
+    if not isinstance(hw_threshold, xarray.DataArray):
+        hw_threshold = xarray.DataArray(np.asarray(hw_threshold), dims=dims[-np.ndim(hw_threshold):])
+    if set(hw_threshold.dims) != set(dims) or any(hw_threshold.sizes[d] != ds.sizes[d] for d in dims):
+        raise ValueError(f"hw_threshold must be a field over {dims} with the grid size of the dataset.")
+    return hw_threshold
+
+
+def _to_map(ds, name, data):
+    """Shape per-cell values like one datetime slice of ds[name] (or of U for derived fields)."""
+    template = ds[name if name in ds else 'U'].transpose('datetime', ...).isel(datetime=0, drop=True)
+    data = np.asarray(data).reshape(template.shape)
+    return xarray.DataArray(data, dims=template.dims, coords=template.coords)
+
+
+def _grouped(maps, groupby, labels):
+    """The single map (groupby None), or the maps of the groups stacked along a groupby dimension."""
+    if groupby is None:
+        return maps[0]
+    return xarray.concat(maps, dim=groupby).assign_coords({groupby: labels})
+
+
+def _to_maps(ds, name, data, WindMin):
+    """
+    _to_map of per-threshold values (M, ncell): a single map for a scalar WindMin, otherwise
+    maps stacked along a 'wind_min' dimension with the thresholds as coordinate.
+    """
+    if np.ndim(WindMin) == 0:
+        return _to_map(ds, name, data[0])
+    maps = [_to_map(ds, name, d) for d in data]
+    return xarray.concat(maps, dim='wind_min').assign_coords(wind_min=np.asarray(WindMin))
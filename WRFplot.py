@@ -5,7 +5,10 @@ Created on Wed Jul 20 16:25:11 2022
 
 @author: salathe
 """
+from profiling import profiled, stage
 
+
+@profiled('WRFplot')
 def WRFplot(
     plotvar,lats,lons,  
     vmin,vmax, 
@@ -32,18 +35,11 @@ def WRFplot(
 
  #   cartopy.config['pre_existing_data_dir'] = '/mmfs1/gscratch/uwb/salathe/cartopy-data/'
 
-    from cartopy.feature import NaturalEarthFeature
-    
+    from basemap import add_basemap, wrf_projection
+
     # Set the cartopy mapping object for the WRF domain
-    #  (Taken from wrf getcartopy and cartopy_xlim)
-    cart_proj = cartopy.crs.LambertConformal(
-            central_longitude=-121.0, 
-            central_latitude=45.665584564208984, 
-            false_easting=0.0, 
-            false_northing=0.0, 
-            standard_parallels=[30.,60.], 
-            globe=None, 
-            cutoff=-30)
+    #  (Taken from wrf getcartopy and cartopy_xlim; shared by all the maps)
+    cart_proj = wrf_projection()
 
     fig = plt.gcf()
     ax = fig.add_subplot(subplot[0],subplot[1],subplot[2], projection=cart_proj)
@@ -74,31 +70,25 @@ def WRFplot(
     else:
         smooth = 'nearest'
         
-    pcolormesh(lons,lats,
-                   plotvar,vmin=vmin,vmax=vmax,
-                   transform=crs.PlateCarree(),
-                   shading=smooth,
-                   cmap=get_cmap(ColMap)
-                   )
+    with stage('pcolormesh'):
+        pcolormesh(lons,lats,
+                       plotvar,vmin=vmin,vmax=vmax,
+                       transform=crs.PlateCarree(),
+                       shading=smooth,
+                       cmap=get_cmap(ColMap)
+                       )
     
     # Add a color bar
-    cbar=colorbar(ax=ax, shrink=.6)#, orientation='horizontal')
-    cbar.set_label(varname)
+    with stage('colorbar'):
+        cbar=colorbar(ax=ax, shrink=.6)#, orientation='horizontal')
+        cbar.set_label(varname)
 
 
     # plt.contour(lons,lats,plotvar, vmin=vmin,vmax=vmax, colors='gray', linewidths=0.5, transform=crs.PlateCarree())
 
 
-    # Download and add the states and coastlines
-    states = NaturalEarthFeature(category='cultural', scale='50m',
-                             facecolor='none',
-                             name='admin_1_states_provinces_lines')
-    ax.add_feature(states, linewidth=.25, edgecolor='grey')
-    borders = NaturalEarthFeature(category='cultural', scale='50m',
-                             facecolor='none',
-                             name='admin_0_boundary_lines_land')
-    ax.add_feature(borders, linewidth=.25, edgecolor='grey')
-    ax.coastlines('50m', linewidth=0.25)
+    # Download and add the states and coastlines (projected once per map extent, see basemap.py)
+    add_basemap(ax)
     
 
     
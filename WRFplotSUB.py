@@ -5,8 +5,10 @@ Created on Wed Jul 20 16:25:11 2022
 
 @author: salathe
 """
+from profiling import profiled, stage
 
 
+@profiled('WRFplot')
 def WRFplot(
         ax,plotvar, lats, lons,
         vmin, vmax,
@@ -17,10 +19,9 @@ def WRFplot(
         map_limits=[0, 0, 0, 0]
         ):
     import numpy as np
-    import matplotlib.pyplot as plt
     from matplotlib.cm import get_cmap
     import cartopy.crs as crs
-    from cartopy.feature import NaturalEarthFeature
+    from basemap import add_basemap
 
     data_crs = crs.PlateCarree()
 
@@ -47,32 +48,29 @@ def WRFplot(
     else:
         smooth = 'nearest'
 
-    mesh = ax.pcolormesh(lons, lats,
-               plotvar, vmin=vmin, vmax=vmax,
-               transform=crs.PlateCarree(),
-               shading=smooth,
-               cmap=get_cmap(ColMap)
-               )
+    with stage('pcolormesh'):
+        mesh = ax.pcolormesh(lons, lats,
+                   plotvar, vmin=vmin, vmax=vmax,
+                   transform=crs.PlateCarree(),
+                   shading=smooth,
+                   cmap=get_cmap(ColMap)
+                   )
 
     # Add a color bar
-    cbar = plt.colorbar(mesh,ax=ax, shrink=.6)  # , orientation='horizontal')
-    cbar.set_label(varname)
+    with stage('colorbar'):
+        cbar = ax.figure.colorbar(mesh,ax=ax, shrink=.6)  # , orientation='horizontal')
+        cbar.set_label(varname)
 
     # plt.contour(lons,lats,plotvar, vmin=vmin,vmax=vmax, colors='gray', linewidths=0.5, transform=crs.PlateCarree())
 
-    # Download and add the states and coastlines
-    states = NaturalEarthFeature(category='cultural', scale='50m',
-                                 facecolor='none',
-                                 name='admin_1_states_provinces_lines')
-    ax.add_feature(states, linewidth=.25, edgecolor='grey')
-    borders = NaturalEarthFeature(category='cultural', scale='50m',
-                                  facecolor='none',
-                                  name='admin_0_boundary_lines_land')
-    ax.add_feature(borders, linewidth=.25, edgecolor='grey')
-    ax.coastlines('50m', linewidth=0.25)
+    # Download and add the states and coastlines (projected once per map extent, see basemap.py)
+    add_basemap(ax)
 
     # Add gridlines
     # ax.gridlines(color='black', linestyle='dotted')
 
     # Add a title
-    ax.set_title(maptitle,fontsize=10)
\ No newline at end of file
+    ax.set_title(maptitle,fontsize=10)
+
+    # The mesh, to update its data with mesh.set_array (see maptemplate.py)
+    return mesh
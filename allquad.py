@@ -1,17 +1,6 @@
-import xarray as xr
-import matplotlib.pyplot as plt
-import cartopy.crs as crs
-from WRFplotSUB import WRFplot
-from pathlib import Path
-
-cart_proj = crs.LambertConformal(
-        central_longitude=-121.0,
-        central_latitude=45.665584564208984,
-        false_easting=0.0,
-        false_northing=0.0,
-        standard_parallels=[30., 60.],
-        globe=None,
-        cutoff=-30)
+from maptemplate import MapTemplate
+import batchplot
+from anomalies import load_cube, member_files
 
 # Average will always be last
 models = ['mri-cgcm3', 'access1.0', 'access1.3', 'canesm2', 'miroc5',"AVERAGE"]
@@ -25,68 +14,50 @@ lon1, lon2 = -124.8,-116.3  # Western and eastern bounds
 max = 6  # deg-C
 min = -max  # Symetrical colorscale
 
-average = dict() # Storage for the data across models
-
-for model in models:
-    # read in the data
-    if model != "AVERAGE":
-        T2quad_hist = xr.open_dataset(f'Data/T2quad_hist_{model}.nc')
-        T2quad_fut = xr.open_dataset(f'Data/T2quad_fut_{model}.nc')
-        lats,lons = T2quad_hist["XLAT"],T2quad_hist["XLONG"] # all the lats and lons are the same right
-
-    for time_frame in ["hist","fut","diff"]:
-
-        fig, axs = plt.subplots(2, 2, subplot_kw={'projection': cart_proj})
-        for i in range(4):
-            quadrant = ["NW", "NE", "SW", "SE"][i]
-            # Data
-            if model != "AVERAGE":
-                datas = {"hist": T2quad_hist['T2_' + quadrant] - T2quad_hist['T2_all'],
-                         "fut": T2quad_fut['T2_' + quadrant] - T2quad_fut['T2_all'],
-                         "diff": (T2quad_fut['T2_' + quadrant] - T2quad_fut['T2_all']) -
-                                 (T2quad_hist['T2_' + quadrant] - T2quad_hist['T2_all'])
-                         }
-
-
-            # Gets the correct data
-            name = f"{time_frame}_{quadrant}"
-            if model != "AVERAGE":
-                data = datas[time_frame]
-
-                # Puts the data into average
-                if name in average:
-                    average[name] += data
-                else:
-                    average[name] = data
-            else:
-                # Average data
-                data = average[name] / (len(models) - 1)
-
-            # Creates the plot
-            row,column = i//2, i%2
-
-            WRFplot(
-                axs[row,column],
-                data,
-                lats, lons,
-                min, max,
-                f'{quadrant}', '°C', 'RdYlBu_r',
-                domain='custom', map_limits=[lon1, lon2, lat1, lat2],  # specify the map limits
-                smflg=0  # Smooth the data
-                )
-        plt.tight_layout()
-        #fig.subplots_adjust(wspace=0.3, hspace=0.2)
-        folder = Path(f"Graphs3/{model}")  # You can change this to a specific path
-        folder.mkdir(parents=True, exist_ok=True)
-
-        filename = f"Graphs3/{model}/{time_frame}.png"
-        plt.suptitle(f"T2 anomaly {model} {time_frame}", x=0.53)
-        plt.savefig(filename, dpi=300, bbox_inches='tight')
-        plt.close()
-
-
-
-
-
-
-
+templates = dict() # Figure templates of the worker process
+
+
+def draw(panels, lats, lons, model, time_frame):
+    """Draws the 2x2 quadrant figure of one model and time frame (run in the batchplot worker processes)"""
+    # The figure is built once per worker, then only the data and titles change
+    if 'quad' not in templates:
+        templates['quad'] = MapTemplate(
+            2, 2,
+            lats, lons,
+            min, max,
+            '°C', 'RdYlBu_r',
+            domain='custom', map_limits=[lon1, lon2, lat1, lat2],  # specify the map limits
+            smflg=0,  # Smooth the data
+            titles=[quadrant for quadrant, data in panels],
+            suptitle_x=0.53
+            )
+    template = templates['quad']
+    template.update(panels, suptitle=f"T2 anomaly {model} {time_frame}")
+    return template.fig
+
+
+if __name__ == '__main__':
+    jobs = [] # Figures to render, drawn in parallel at the end
+
+    # Anomalies of all the models and their average, computed once (see anomalies.py)
+    cube = load_cube(models=models[:-1])
+    lats, lons = cube["XLAT"].values, cube["XLONG"].values
+
+    for model in models:
+        if model != "AVERAGE":
+            anomaly, files = cube['anomaly'].sel(model=model), member_files([model])
+        else:
+            anomaly, files = cube['mean'], member_files(models[:-1])
+
+        for time_frame in ["hist","fut","diff"]:
+            panels = [(quadrant, anomaly.sel(period=time_frame, quadrant=quadrant).values)
+                      for quadrant in ["NW", "NE", "SW", "SE"]]
+
+            # Queues the figure, saved to Graphs3/{model}/{time_frame}.png
+            filename = f"Graphs3/{model}/{time_frame}.png"
+            jobs.append((draw, filename, files,
+                         dict(panels=panels, lats=lats, lons=lons, model=model, time_frame=time_frame)))
+
+    # Renders the figures that are missing or older than their data, on all cores
+    written = batchplot.render(jobs)
+    print(f'Saved {len(written)} graphs ({len(jobs) - len(written)} up to date)')
@@ -0,0 +1,110 @@
+"""
+anomalies.py
+
+Ensemble anomaly cube: loads all the Data/T2quad_{hist,fut}_{model}.nc files once and
+computes the quadrant anomalies, their future - historical differences and the ensemble
+statistics in vectorised form, into one NetCDF file the plot scripts index into.
+
+Variables of the cube (dimensions model, period = hist/fut/diff, quadrant, south_north, west_east):
+    - anomaly: T2_<quadrant> - T2_all for each model; 'diff' is fut - hist.
+    - mean: Ensemble mean of anomaly (no model dimension), NaN where a model has no data.
+    - spread: Ensemble standard deviation of anomaly (ddof=1).
+    - agreement: Fraction of the models whose anomaly has the sign of the ensemble mean.
+
+Functions:
+    - anomaly_cube(models=MODELS, data_path='Data/', prefix='T2quad', quadrants=WIND_LABELS):
+        Builds the cube from the member files.
+    - load_cube(path=CUBE_PATH, models=MODELS, data_path='Data/', prefix='T2quad'):
+        Reads the cube, rebuilding it first if it is missing or out of date.
+    - member_files(models=MODELS, data_path='Data/', prefix='T2quad'):
+        The member files the cube is made from.
+
+Example:
+    python anomalies.py   # writes Data/T2anom.nc
+"""
+import os
+
+import numpy as np
+import xarray as xr
+
+from ensemble import MODELS, WIND_LABELS
+
+# Default location of the cube
+CUBE_PATH = 'Data/T2anom.nc'
+
+# Periods of the member files
+MEMBER_PERIODS = ['hist', 'fut']
+
+
+def member_files(models=MODELS, data_path='Data/', prefix='T2quad'):
+    """Paths of the '{prefix}_{period}_{model}.nc' files, model by model."""
+    return [os.path.join(data_path, f'{prefix}_{period}_{model}.nc') for model in models for period in MEMBER_PERIODS]
+
+
+def anomaly_cube(models=MODELS, data_path='Data/', prefix='T2quad', quadrants=WIND_LABELS):
+    """
+    Build the anomaly cube from the member files.
+
+    Parameters:
+        models (list of str): GCM names. Default is MODELS.
+        data_path (str): Directory of the member files.
+        prefix (str): File name prefix, as in ensemble.write_members.
+        quadrants (list of str): Wind sector labels. Default is WIND_LABELS.
+
+    Returns:
+        xarray.Dataset: anomaly, mean, spread and agreement, with XLAT/XLONG coordinates.
+    """
+    names = ['T2_all'] + [f'T2_{quadrant}' for quadrant in quadrants]
+    members = []
+    for model in models:
+        periods = []
+        for period in MEMBER_PERIODS:
+            with xr.open_dataset(os.path.join(data_path, f'{prefix}_{period}_{model}.nc')) as ds:
+                periods.append(ds[names].to_array('quadrant').load())
+        members.append(xr.concat(periods, dim='period'))
+    T2 = xr.concat(members, dim='model').assign_coords(model=models, period=MEMBER_PERIODS,
+                                                       quadrant=['all'] + list(quadrants))
+
+    anomaly = T2.sel(quadrant=list(quadrants)) - T2.sel(quadrant='all', drop=True)
+    diff = anomaly.sel(period='fut') - anomaly.sel(period='hist')
+    anomaly = xr.concat([anomaly, diff.assign_coords(period='diff')], dim='period')
+
+    # Ensemble statistics only where every model has data, as the plot scripts have always averaged
+    mean = anomaly.mean('model', skipna=False)
+    cube = xr.Dataset({
+        'anomaly': anomaly,
+        'mean': mean,
+        'spread': anomaly.std('model', ddof=1, skipna=False),
+        'agreement': (np.sign(anomaly) == np.sign(mean)).where(mean.notnull()).mean('model'),
+    })
+    cube['anomaly'].attrs = {'long_name': 'T2 quadrant anomaly (T2_quadrant - T2_all)', 'units': 'K'}
+    cube['mean'].attrs = {'long_name': 'Ensemble mean T2 quadrant anomaly', 'units': 'K'}
+    cube['spread'].attrs = {'long_name': 'Ensemble standard deviation of the T2 quadrant anomaly', 'units': 'K'}
+    cube['agreement'].attrs = {'long_name': 'Fraction of models agreeing on the sign of the ensemble mean'}
+    return cube
+
+
+def load_cube(path=CUBE_PATH, models=MODELS, data_path='Data/', prefix='T2quad'):
+    """
+    Read the anomaly cube from path, (re)building and writing it first if it is missing,
+    older than one of the member files or made for other models.
+
+    Returns:
+        xarray.Dataset: The cube, loaded in memory.
+    """
+    from batchplot import up_to_date
+
+    if up_to_date(path, member_files(models, data_path, prefix)):
+        cube = xr.load_dataset(path)
+        if list(cube['model'].values) == list(models):
+            return cube
+
+    cube = anomaly_cube(models, data_path, prefix)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    cube.to_netcdf(tmp)
+    os.replace(tmp, path)
+    return cube
+
+
+if __name__ == '__main__':
+    print(load_cube())
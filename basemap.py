@@ -0,0 +1,104 @@
+"""
+basemap.py
+
+The WRF map projection and the Natural Earth basemap (states, borders, coastlines) of the
+WRFplot maps, selected and projected once per (projection, map extent) and reused.
+
+Cartopy features select and reproject the 50m shapefile lines again for every axes (and
+on every draw). Here the layers are turned into matplotlib paths in map coordinates the
+first time an extent is drawn; later axes with the same projection and extent only add a
+PathCollection of the cached paths.
+
+Functions:
+    - wrf_projection():
+        The LambertConformal projection of the WRF domain (one shared instance).
+    - add_basemap(ax):
+        Adds the states, borders and coastlines to a GeoAxes, from the cache when possible.
+
+The paths cover the lines in the extent of the axes when add_basemap is called (plus a
+margin), so set the map limits first.
+"""
+import functools
+
+from profiling import profiled
+
+# Natural Earth 50m layers: (category, name, style), drawn in this order
+LAYERS = [
+    ('cultural', 'admin_1_states_provinces_lines', dict(linewidth=.25, edgecolor='grey')),
+    ('cultural', 'admin_0_boundary_lines_land', dict(linewidth=.25, edgecolor='grey')),
+    ('physical', 'coastline', dict(linewidth=0.25, edgecolor='black')),
+]
+
+# Fraction of the map size added around the extent when selecting the lines
+MARGIN = 0.05
+
+# Projected paths of each layer, by (projection, extent)
+_PATHS = {}
+
+
+@functools.lru_cache(maxsize=None)
+def wrf_projection():
+    """The LambertConformal projection of the WRF domain (taken from wrf getcartopy)."""
+    import cartopy.crs as crs
+
+    return crs.LambertConformal(
+        central_longitude=-121.0,
+        central_latitude=45.665584564208984,
+        false_easting=0.0,
+        false_northing=0.0,
+        standard_parallels=[30., 60.],
+        globe=None,
+        cutoff=-30)
+
+
+@functools.lru_cache(maxsize=None)
+def _feature(category, name):
+    from cartopy.feature import NaturalEarthFeature
+
+    return NaturalEarthFeature(category=category, scale='50m', facecolor='none', name=name)
+
+
+@profiled('basemap_paths')
+def _layer_paths(ax):
+    """Paths of LAYERS in the coordinates of ax, for the lines in its extent; cached by projection and extent."""
+    from matplotlib.path import Path
+    from cartopy.mpl.path import shapely_to_path
+
+    x0, x1, y0, y1 = ax.get_extent()
+    key = (ax.projection.to_wkt(), round(x0), round(x1), round(y0), round(y1))
+    if key not in _PATHS:
+        layers = []
+        for category, name, style in LAYERS:
+            feature = _feature(category, name)
+            # Select the lines near the map, then transform their vertices (the 50m lines are
+            # dense enough not to need the resampling of project_geometry); the axes clip the rest
+            lon0, lon1, lat0, lat1 = ax.get_extent(feature.crs)
+            dlon, dlat = MARGIN * (lon1 - lon0), MARGIN * (lat1 - lat0)
+            paths = []
+            for geom in feature.intersecting_geometries((lon0 - dlon, lon1 + dlon, lat0 - dlat, lat1 + dlat)):
+                path = shapely_to_path(geom)
+                xy = ax.projection.transform_points(feature.crs, path.vertices[:, 0], path.vertices[:, 1])
+                paths.append(Path(xy[:, :2], path.codes))
+            layers.append((paths, style))
+        _PATHS[key] = layers
+    return _PATHS[key]
+
+
+@profiled('add_basemap')
+def add_basemap(ax):
+    """
+    Add the Natural Earth states, borders and coastlines (50m) to the GeoAxes ax.
+
+    Returns:
+        list of matplotlib.collections.PathCollection: One collection per layer.
+    """
+    from matplotlib.collections import PathCollection
+
+    collections = []
+    for paths, style in _layer_paths(ax):
+        # Same look as a cartopy FeatureArtist: unfilled, above the data mesh, clipped to the map
+        collection = PathCollection(paths, facecolor='none', transform=ax.transData, zorder=1.5, **style)
+        collection.set_clip_path(ax.patch)
+        ax.add_collection(collection, autolim=False)
+        collections.append(collection)
+    return collections
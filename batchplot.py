@@ -0,0 +1,100 @@
+"""
+batchplot.py
+
+Batch rendering of the map figures on a process pool.
+
+A figure job is a tuple (draw, filename, inputs, kwargs): draw(**kwargs) draws one figure
+(on plt.gcf() or a figure of its own, e.g. from plt.subplots), which is saved to filename.
+draw may also return the figure to save, e.g. a maptemplate.MapTemplate figure reused by
+the jobs of a worker.
+inputs lists the data files the figure is made from; jobs whose PNG is already newer than
+all its inputs are skipped.
+Workers use the non-interactive Agg backend, so rendering scales with the number of cores.
+With profiling.py enabled, the stages recorded in the workers are added to the records of
+the calling process.
+
+draw must be a module-level function (it is sent to the worker processes), and scripts
+calling render must guard their batch code with `if __name__ == '__main__':`.
+
+Functions:
+    - render(jobs, processes=None, force=False, dpi=300):
+        Renders the out-of-date jobs in parallel and returns the files written.
+    - up_to_date(filename, inputs):
+        True if filename exists and is newer than every input file.
+
+Example:
+    jobs = [(draw_map, f'Graphs/{model}.png', [f'Data/T2quad_hist_{model}.nc'], {'model': model})
+            for model in models]
+    render(jobs)
+"""
+import os
+
+
+def up_to_date(filename, inputs):
+    """True if filename exists and is newer than every file in inputs."""
+    if not os.path.exists(filename):
+        return False
+    mtime = os.path.getmtime(filename)
+    return all(os.path.getmtime(path) < mtime for path in inputs)
+
+
+def _init_worker():
+    import matplotlib
+    import profiling
+
+    matplotlib.use('Agg')
+    # Forked workers inherit the records of the parent, which already has them
+    profiling.take_records()
+
+
+def _render_job(job, dpi, profile=False):
+    """Draw one job and save its figure (in a worker process); profile records its stages."""
+    import matplotlib.pyplot as plt
+    import profiling
+
+    if profile and not profiling.enabled():
+        profiling.enable()
+    draw, filename, inputs, kwargs = job
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+    try:
+        with profiling.stage('draw', filename=filename):
+            fig = draw(**kwargs) or plt.gcf()
+        # Write next to the target and rename, so an interrupted run leaves no partial PNG
+        tmp = f'{filename}.{os.getpid()}.tmp.png'
+        with profiling.stage('savefig', filename=filename):
+            fig.savefig(tmp, dpi=dpi, bbox_inches='tight')
+        os.replace(tmp, filename)
+    finally:
+        plt.close('all')
+    return filename, profiling.take_records()
+
+
+def render(jobs, processes=None, force=False, dpi=300):
+    """
+    Render figure jobs on a process pool with the Agg backend.
+
+    Parameters:
+        jobs (list of tuple): (draw, filename, inputs, kwargs) figure jobs.
+        processes (int, optional): Number of worker processes. Default is the CPU count.
+        force (bool, optional): Render every job, even if its PNG is up to date. Default is False.
+        dpi (int, optional): Resolution of the saved figures. Default is 300.
+
+    Returns:
+        list of str: The files written, in the order of jobs.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    import profiling
+
+    todo = [job for job in jobs if force or not up_to_date(job[1], job[2])]
+    if not todo:
+        return []
+    processes = min(len(todo), processes or os.cpu_count() or 1)
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker) as pool:
+        futures = [pool.submit(_render_job, job, dpi, profiling.enabled()) for job in todo]
+        written = []
+        for future in futures:
+            filename, records = future.result()
+            profiling.add_records(records)
+            written.append(filename)
+        return written
@@ -0,0 +1,113 @@
+"""
+sector_backends.py
+
+Check that the compiled (numba) and NumPy engines of the WRF_wind sector means and counts
+give identical results, and compare their run times.
+
+The cases cover WindMin sweeps, the heat wave filter, wind speed statistics, counts,
+monthly groups, overlapping and wrapping sectors, float64 data, NaN samples and samples
+exactly on the sector boundaries. Every result must be equal to the last bit.
+
+The only inputs the engines may assign differently are winds within rounding of a sector
+boundary that is not exactly representable (the vectorised NumPy arctan2 and the libm atan2
+of the kernel can differ in the last bit): such samples, a few per 10^8, are snapped onto
+the north-south axis first (see off_boundaries).
+
+tests/test_sector_backends.py checks the same on small data without snapping, with the
+uncompiled kernel when numba is not installed.
+
+Run from the repository root (needs numba):
+    python -m benchmarks.sector_backends
+"""
+import time
+
+import numpy as np
+
+import WRF_wind as Wwnd
+from benchmarks.synthetic import synthetic_wrf, wind_sectors
+
+# Overlapping and wrapping ranges: quadrants, a north-centred half and an east-west band
+OVERLAPPING = (np.array([[0, 90], [90, 180], [180, 270], [270, 360], [270, 90], [45, 135]]),
+               ['NE', 'SE', 'SW', 'NW', 'N', 'E'])
+
+# name -> (function, keyword arguments)
+CASES = {
+    'mean': ('avg_from_wind', dict(WindMin=1)),
+    'mean_sweep': ('avg_from_wind', dict(WindMin=[0, 1, 2.5, 5, 10])),
+    'mean_hw': ('avg_from_wind', dict(WindMin=1, hw_filt=True)),
+    'wspd': ('avg_from_wind', dict(field='WSPD')),
+    'count': ('count_wind_days', dict(WindMin=[0, 2])),
+    'count_hw': ('count_wind_days', dict(hw_filt=True)),
+    'mean_month': ('avg_from_wind', dict(WindMin=1, groupby='month', block_size=500)),
+    'mean_float32': ('avg_from_wind', dict(WindMin=1, dtype=np.float32)),
+}
+
+
+def edge_cases(ds):
+    """ds with NaN samples, calm samples and winds exactly from the sector boundaries."""
+    ds = ds.copy(deep=True)
+    U, V, T2 = ds['U'].values, ds['V'].values, ds['T2'].values
+    T2[::7, 0, :] = np.nan
+    U[::5, 1, :] = np.nan
+    U[::3, 2, :], V[::3, 2, :] = 0, 0
+    U[1::3, 2, :], V[1::3, 2, :] = 0, -4        # from 0 (north)
+    U[2::3, 3, :], V[2::3, 3, :] = -4, 0        # from 90
+    U[::2, 4, :], V[::2, 4, :] = 3, 3           # from 225
+    return ds
+
+
+def off_boundaries(ds, wind_dir, tol=1e-3):
+    """ds with the winds within tol degrees of a sector boundary (not on an axis) turned north-south (U = 0)."""
+    U, V = ds['U'].values, ds['V'].values
+    direction = Wwnd._wind_direction(U, V)
+    near = np.zeros(U.shape, dtype=bool)
+    for bound in np.unique(np.asarray(wind_dir, dtype=float) % 360):
+        near |= np.abs((direction - bound + 180) % 360 - 180) < tol
+    near &= (U != 0) & (V != 0)
+    return ds.assign(U=ds['U'].where(~near, 0))
+
+
+def check(ds, wind_dir, wind_label):
+    """Run every case with both engines; return the run times, asserting identical results."""
+    ds = off_boundaries(ds, wind_dir)
+    times = {}
+    for case, (func, kwargs) in CASES.items():
+        results = {}
+        for backend in ('numpy', 'numba'):
+            t0 = time.perf_counter()
+            results[backend] = getattr(Wwnd, func)(ds, wind_dir, wind_label, backend=backend, **kwargs)
+            times[case, backend] = time.perf_counter() - t0
+        for name in results['numpy'].data_vars:
+            np.testing.assert_array_equal(results['numba'][name].values, results['numpy'][name].values,
+                                          err_msg=f'{case}: {name}')
+    return times
+
+
+def main(n_time=2920, ny=104, nx=73, sectors=(4, 16)):
+    import warnings
+    import wind_kernels
+
+    warnings.filterwarnings("ignore", message="All-NaN slice encountered")
+    if not wind_kernels.available():
+        raise SystemExit('numba is not installed: only the NumPy engine is available.')
+
+    # Small data first: compiles the kernel and checks the edge cases
+    small = edge_cases(synthetic_wrf(48, 8, 6, seed=1))
+    for wind_dir, wind_label in [wind_sectors(4), OVERLAPPING]:
+        check(small, wind_dir, wind_label)
+        check(small.astype(np.float64), wind_dir, wind_label)
+    print('small and edge cases: identical')
+
+    ds = synthetic_wrf(n_time, ny, nx)
+    print(f'{n_time} x {ny} x {nx} samples')
+    print(f'{"case":<14} {"sectors":>8} {"numpy [s]":>10} {"numba [s]":>10} {"speedup":>8}')
+    for n in sectors:
+        times = check(ds, *wind_sectors(n))
+        for case in CASES:
+            t_np, t_nb = times[case, 'numpy'], times[case, 'numba']
+            print(f'{case:<14} {n:>8} {t_np:>10.2f} {t_nb:>10.2f} {t_np / t_nb:>7.1f}x')
+    print('all cases: identical')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+suite.py
+
+Benchmark suite for the WRF_wind statistics: times get_wrf850UVT, avg_from_wind (mean,
+percentile, with and without the heat wave filter, per month, with the NumPy engine when
+numba is installed) and count_wind_days on synthetic WRF-like cubes, records the peak RSS
+of each case and saves the results as JSON so runs of different commits can be compared.
+
+Each case runs in a fresh process, so its peak RSS is not hidden by earlier cases.
+
+Run from the repository root:
+    python -m benchmarks.suite --n-time 2920 --sectors 4 16 --output bench.json
+    python -m benchmarks.suite --compare bench.json      # rerun and compare with an earlier run
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# Benchmark cases: name -> (function, keyword arguments)
+CASES = {
+    'get_wrf850UVT': ('get_wrf850UVT', {}),
+    'avg_mean': ('avg_from_wind', dict(stat='mean', WindMin=1)),
+    'avg_mean_numpy': ('avg_from_wind', dict(stat='mean', WindMin=1, backend='numpy')),
+    'avg_percentile': ('avg_from_wind', dict(stat=50, WindMin=1)),
+    'avg_mean_hw': ('avg_from_wind', dict(stat='mean', WindMin=1, hw_filt=True)),
+    'avg_percentile_hw': ('avg_from_wind', dict(stat=50, WindMin=1, hw_filt=True)),
+    'count': ('count_wind_days', dict(WindMin=1)),
+    'count_hw': ('count_wind_days', dict(WindMin=1, hw_filt=True)),
+    'avg_mean_month': ('avg_from_wind', dict(stat='mean', WindMin=1, groupby='month')),
+    'avg_percentile_month': ('avg_from_wind', dict(stat=50, WindMin=1, groupby='month')),
+}
+
+
+def _rss_mb():
+    """Peak resident set size of this process so far, in MiB."""
+    import resource
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 2 ** 20 if sys.platform == 'darwin' else maxrss / 2 ** 10
+
+
+def _run_case(case, n_time, ny, nx, sectors, repeat, path):
+    """Time one case in the current process; returns its result record."""
+    import warnings
+    import WRF_wind as Wwnd
+    from benchmarks.synthetic import synthetic_wrf, wind_sectors
+
+    warnings.filterwarnings("ignore", message="All-NaN slice encountered")
+    func, kwargs = CASES[case]
+    wind_dir, wind_label = wind_sectors(sectors)
+
+    if func == 'get_wrf850UVT':
+        ds = synthetic_wrf(n_time, ny, nx)
+        lat, lon = ds['XLAT'].values, ds['XLONG'].values
+        mask_range = [float(lon.min()) + 1, float(lon.max()) - 1, float(lat.min()) + 1, float(lat.max()) - 1]
+        del ds
+
+        def run():
+            Wwnd.get_wrf850UVT(path, mask_range=mask_range).load().close()
+    else:
+        ds = synthetic_wrf(n_time, ny, nx)
+
+        def run():
+            getattr(Wwnd, func)(ds, wind_dir, wind_label, **kwargs)
+
+    base = _rss_mb()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - t0)
+
+    return {
+        'case': case,
+        'function': func,
+        'kwargs': dict(kwargs),
+        'sectors': sectors,
+        'times': times,
+        'best': min(times),
+        'median': float(np.median(times)),
+        'base_rss_mb': base,
+        'peak_rss_mb': _rss_mb(),
+    }
+
+
+def _metadata(args):
+    import platform
+    import subprocess
+
+    import xarray
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'xarray': xarray.__version__,
+        'platform': platform.platform(),
+        'n_time': args.n_time,
+        'ny': args.ny,
+        'nx': args.nx,
+        'repeat': args.repeat,
+    }
+
+
+def run_suite(n_time=2920, ny=104, nx=73, sectors=(4, 16), cases=tuple(CASES), repeat=3):
+    """
+    Run the benchmark cases, each in a fresh process.
+
+    Returns:
+        list of dict: One record per (case, sector count) with the times (s) and peak RSS (MiB).
+    """
+    import multiprocessing
+    import tempfile
+    from concurrent.futures import ProcessPoolExecutor
+    from benchmarks.synthetic import synthetic_wrf
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'wrf850UVT.nc')
+        if 'get_wrf850UVT' in cases:
+            synthetic_wrf(n_time, ny, nx).to_netcdf(path)
+
+        for case in cases:
+            for n in ((sectors[0],) if case == 'get_wrf850UVT' else sectors):
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                    result = pool.submit(_run_case, case, n_time, ny, nx, n, repeat, path).result()
+                print(f'{case:>20} {n:>8} {result["best"]:>9.3f} {result["median"]:>10.3f} '
+                      f'{result["peak_rss_mb"]:>9.0f} {result["peak_rss_mb"] - result["base_rss_mb"]:>10.0f}',
+                      flush=True)
+                results.append(result)
+    return results
+
+
+def compare(results, reference):
+    """Print the median time and peak RSS ratios of results against an earlier run."""
+    old = {(r['case'], r['sectors']): r for r in reference['results']}
+    print(f'\ncompared with {reference["meta"].get("commit")} ({reference["meta"].get("date")})')
+    print(f'{"case":>20} {"sectors":>8} {"time":>8} {"peak RSS":>9}')
+    for r in results:
+        ref = old.get((r['case'], r['sectors']))
+        if ref is None:
+            continue
+        print(f'{r["case"]:>20} {r["sectors"]:>8} {r["median"] / ref["median"]:>7.2f}x '
+              f'{r["peak_rss_mb"] / ref["peak_rss_mb"]:>8.2f}x')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the WRF_wind statistics on synthetic data.')
+    parser.add_argument('--n-time', type=int, default=2920, help='datetime steps (default: %(default)s)')
+    parser.add_argument('--ny', type=int, default=104, help='south_north size (default: %(default)s)')
+    parser.add_argument('--nx', type=int, default=73, help='west_east size (default: %(default)s)')
+    parser.add_argument('--sectors', type=int, nargs='+', default=[4, 16], help='sector counts (default: %(default)s)')
+    parser.add_argument('--cases', nargs='+', default=list(CASES), choices=list(CASES),
+                        help='cases to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per case (default: %(default)s)')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+    args = parser.parse_args(argv)
+
+    print(f'{args.n_time} x {args.ny} x {args.nx} samples')
+    print(f'{"case":>20} {"sectors":>8} {"best [s]":>9} {"median [s]":>10} {"peak [MB]":>9} {"delta [MB]":>10}')
+    results = run_suite(args.n_time, args.ny, args.nx, args.sectors, args.cases, args.repeat)
+    report = {'meta': _metadata(args), 'results': results}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return report
+
+
+if __name__ == '__main__':
+    main()
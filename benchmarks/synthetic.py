@@ -0,0 +1,54 @@
+"""
+synthetic.py
+
+Synthetic WRF-like 850 hPa datasets for benchmarking the WRF_wind statistics.
+
+The datasets mimic the files read by WRF_wind.get_wrf850UVT: float32 'U', 'V' and 'T2'
+on (datetime, south_north, west_east) with 2-D 'XLAT' / 'XLONG' coordinates over the
+Pacific Northwest.
+"""
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+
+def synthetic_wrf(n_time=2920, ny=104, nx=73, freq='3h', seed=0):
+    """
+    Build a synthetic WRF 850 hPa dataset.
+
+    Parameters:
+        n_time (int): Number of datetime steps. Default is one year of 3-hourly data.
+        ny, nx (int): Grid size (south_north, west_east). Default is the PNW crop.
+        freq (str): Time step, as a pandas frequency string.
+        seed (int): Random seed.
+
+    Returns:
+        xarray.Dataset: Dataset with U, V (m/s) and T2 (K).
+    """
+    rng = np.random.default_rng(seed)
+    lat = np.linspace(38.5, 50.5, ny)[:, None] + np.linspace(0, 0.6, nx)[None, :]
+    lon = np.linspace(-126, -115, nx)[None, :] + np.linspace(-0.8, 0.8, ny)[:, None]
+
+    # A diurnal/seasonal temperature signal plus noise, warmer with offshore (easterly) winds
+    hours = np.arange(n_time) * pd.Timedelta(freq) / pd.Timedelta('1h')
+    cycle = 8 * np.sin(2 * np.pi * hours / 8766) + 4 * np.sin(2 * np.pi * hours / 24)
+    U = rng.normal(1, 6, (n_time, ny, nx)).astype(np.float32)
+    V = rng.normal(0, 6, (n_time, ny, nx)).astype(np.float32)
+    T2 = (285 + cycle[:, None, None] - 0.3 * U
+          + rng.normal(0, 3, (n_time, ny, nx))).astype(np.float32)
+
+    dims = ('datetime', 'south_north', 'west_east')
+    return xr.Dataset(
+        {'U': (dims, U), 'V': (dims, V), 'T2': (dims, T2)},
+        coords={
+            'XLAT': (('south_north', 'west_east'), lat.astype(np.float32)),
+            'XLONG': (('south_north', 'west_east'), lon.astype(np.float32)),
+            'datetime': pd.date_range('1970-01-01', periods=n_time, freq=freq),
+        },
+    )
+
+
+def wind_sectors(n):
+    """n equal wind direction sectors starting at north, with labels S0..S(n-1)."""
+    edges = np.arange(n + 1) * 360 / n
+    return np.stack([edges[:-1], edges[1:]], axis=1), [f'S{i}' for i in range(n)]
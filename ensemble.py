@@ -0,0 +1,179 @@
+"""
+ensemble.py
+
+Runs the WRF_wind statistics for every member of the GCM-driven WRF ensemble and both time
+periods on a process pool, and gathers the results into one Dataset with 'model' and
+'period' dimensions.
+
+Functions:
+    - member_stats(path, ...):
+        Loads one WRF file with get_wrf850UVT and computes avg_from_wind or count_wind_days.
+    - run_member(model, period, path, ...):
+        member_stats for one ensemble member, through the on-disk wind_cache.
+    - run_ensemble(models=MODELS, periods=PERIODS, ..., store=None):
+        Runs all (model, period) members in parallel and concatenates them; with store, each
+        member is also appended to a stats_store file as soon as it finishes.
+    - ensemble_mean(ds):
+        Mean over the 'model' dimension.
+    - write_members(ds, data_path='Data/', prefix='T2quad'):
+        Writes one '{prefix}_{period}_{model}.nc' file per member, as read by the plot scripts.
+
+Example:
+    python ensemble.py   # recomputes Data/T2quad_{hist,fut}_{model}.nc and the Data/T2stats.nc store
+"""
+import numpy as np
+import xarray as xr
+
+import WRF_wind as Wwnd
+import wind_cache
+import stats_store
+
+# GCMs driving the WRF runs
+MODELS = ['mri-cgcm3', 'access1.0', 'access1.3', 'canesm2', 'miroc5']
+
+# WRF 850 hPa input file for each period (adjust to the local file names). A glob pattern,
+# e.g. '1970/wrf850UVT{model}_*.nc', opens a run split into several files as one dataset.
+PERIODS = {
+    'hist': '1970wrf850UVT{model}.nc',
+    'fut': '2070wrf850UVT{model}.nc',
+}
+
+# Geographic range of the PNW maps, and the crop used when loading the data
+lat1, lat2 = 40, 49.5  # Southern and northern bounds
+lon1, lon2 = -124.8, -116.3  # Western and eastern bounds
+MASK_RANGE = [lon1 - 1, lon2 + 1, lat1 - 1, lat2 + 1]
+
+# Wind quadrants
+WIND_DIR = np.array([[0, 90], [90, 180], [180, 270], [270, 360]])
+WIND_LABELS = ['NE', 'SE', 'SW', 'NW']
+
+
+def member_stats(path, wind_dir=WIND_DIR, wind_label=WIND_LABELS, kind='temp', mask_range=MASK_RANGE, hw_reference=None,
+                 **kwargs):
+    """
+    Load one WRF file with get_wrf850UVT and compute its wind statistics.
+
+    Parameters:
+        path (str): Path to the WRF 850 hPa file, or a glob pattern of the files of the run.
+        wind_dir, wind_label: Wind direction ranges and labels, as in WRF_wind.avg_from_wind.
+        kind (str): 'temp' for avg_from_wind or 'winds' for count_wind_days.
+        mask_range (list): Spatial crop passed to get_wrf850UVT.
+        hw_reference (str, optional): WRF file whose T2 percentile (hw_pct) is the heat wave threshold,
+                                      e.g. the historical run of the same model for a future run.
+        **kwargs: Passed to avg_from_wind / count_wind_days (WindMin, stat, hw_filt, hw_pct, ...).
+
+    Returns:
+        xarray.Dataset: The statistics, loaded in memory.
+    """
+    if hw_reference is not None:
+        ref = Wwnd.get_wrf850UVT(hw_reference, mask_range=mask_range)
+        kwargs['hw_threshold'] = Wwnd.heatwave_threshold(ref, kwargs.get('hw_pct', 95)).load()
+        ref.close()
+
+    ds = Wwnd.get_wrf850UVT(path, mask_range=mask_range)
+    if kind == 'temp':
+        out = Wwnd.avg_from_wind(ds, wind_dir, wind_label, **kwargs)
+    elif kind == 'winds':
+        out = Wwnd.count_wind_days(ds, wind_dir, wind_label, **kwargs)
+    else:
+        raise ValueError("Please set 'kind' to 'temp' or 'winds'.")
+    out = out.load()
+    ds.close()
+    return out
+
+
+def run_member(model, period, path, wind_dir=WIND_DIR, wind_label=WIND_LABELS, kind='temp',
+               mask_range=MASK_RANGE, cache=True, hw_reference=None, **kwargs):
+    """
+    Compute the wind statistics of one ensemble member.
+
+    Parameters:
+        model (str): GCM name.
+        period (str): Period name, e.g. 'hist' or 'fut'.
+        path (str): Path to the WRF 850 hPa file.
+        wind_dir, wind_label, kind, mask_range, hw_reference, **kwargs: As in member_stats.
+        cache (bool): Reuse results from the wind_cache when the file and parameters are unchanged.
+
+    Returns:
+        xarray.Dataset: Statistics with scalar 'model' and 'period' coordinates.
+    """
+    params = dict(wind_dir=wind_dir, wind_label=wind_label, kind=kind, mask_range=mask_range,
+                  hw_reference=hw_reference, **kwargs)
+    if cache:
+        out = wind_cache.cached(member_stats, path, depends=[hw_reference] if hw_reference else [], **params)
+    else:
+        out = member_stats(path, **params)
+    return out.assign_coords(model=model, period=period)
+
+
+def run_ensemble(models=MODELS, periods=PERIODS, data_path='Data/', processes=None, hw_period=None, store=None,
+                 **kwargs):
+    """
+    Compute the wind statistics for all models and periods on a process pool.
+
+    Parameters:
+        models (list of str): GCM names. Default is MODELS.
+        periods (dict): Period name -> file name template with a {model} field. Default is PERIODS.
+        data_path (str): Directory holding the WRF files.
+        processes (int, optional): Number of worker processes. Default is one per member, up to the CPU count.
+        hw_period (str, optional): Period whose T2 percentile is the heat wave threshold of every period of the
+                                   same model (e.g. 'hist'). Default is None (each run uses its own).
+        store (str, optional): stats_store file each member is written to when it finishes (appended, or
+                               overwritten if the member is already there). Default is None.
+        **kwargs: Passed to run_member (wind_dir, wind_label, kind, mask_range, cache, WindMin, stat, ...).
+
+    Returns:
+        xarray.Dataset: Statistics with dimensions ('model', 'period', ...).
+    """
+    import os
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    members = [(model, period) for model in models for period in periods]
+    if processes is None:
+        processes = min(len(members), os.cpu_count() or 1)
+
+    def path(model, period):
+        return os.path.join(data_path, periods[period].format(model=model))
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = {
+            (model, period): pool.submit(run_member, model, period, path(model, period),
+                                         hw_reference=path(model, hw_period) if hw_period else None,
+                                         **kwargs)
+            for model, period in members
+        }
+        pending = {future: member for member, future in futures.items()}
+        results = {}
+        for future in as_completed(pending):
+            model, period = pending[future]
+            results[(model, period)] = future.result()
+            if store:
+                stats_store.write_store(store, results[(model, period)].drop_vars(['model', 'period']), model, period,
+                                        kwargs.get('wind_label', WIND_LABELS))
+
+    return xr.concat(
+        [xr.concat([results[(model, period)] for period in periods], dim='period')
+         for model in models],
+        dim='model',
+    )
+
+
+def ensemble_mean(ds):
+    """Ensemble mean: the mean of ds over the 'model' dimension."""
+    return ds.mean(dim='model', keep_attrs=True)
+
+
+def write_members(ds, data_path='Data/', prefix='T2quad'):
+    """Write each member of ds to '{data_path}{prefix}_{period}_{model}.nc'."""
+    import os
+
+    for model in ds['model'].values:
+        for period in ds['period'].values:
+            member = ds.sel(model=model, period=period).drop_vars(['model', 'period'])
+            member.to_netcdf(os.path.join(data_path, f'{prefix}_{period}_{model}.nc'))
+
+
+if __name__ == '__main__':
+    ds = run_ensemble(kind='temp', WindMin=1, stat=50, store=stats_store.STORE_PATH)
+    write_members(ds)
+    print(ensemble_mean(ds))
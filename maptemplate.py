@@ -0,0 +1,98 @@
+"""
+maptemplate.py
+
+Reusable multi-panel map figure for batch exports.
+
+A MapTemplate builds the axes, meshes, colorbars and basemap of a WRFplotSUB layout once;
+each output then only swaps the mesh data (QuadMesh.set_array) and the titles before
+saving, instead of rebuilding the whole figure.
+
+The figure is not managed by pyplot, so plt.close('all') (e.g. in batchplot) leaves it
+open for the next output.
+
+Example:
+    template = MapTemplate(2, 2, lats, lons, -6, 6, '°C', 'RdYlBu_r',
+                           domain='custom', map_limits=[lon1, lon2, lat1, lat2], smflg=0,
+                           titles=['NW', 'NE', 'SW', 'SE'])
+    for model in models:
+        template.update([(quadrant, data[model][quadrant]) for quadrant in quadrants],
+                        suptitle=f'T2 anomaly {model}')
+        template.save(f'Graphs3/{model}.png')
+"""
+import numpy as np
+
+from profiling import profiled
+
+
+class MapTemplate:
+    """
+    A figure of nrows x ncols WRFplotSUB maps sharing the grid, color scale and map limits.
+
+    Parameters:
+        nrows, ncols (int): Layout of the panels.
+        lats, lons (array-like): 2-D latitude and longitude of the grid.
+        vmin, vmax (float): Color scale limits; -999 uses the min/max of each panel's data.
+        varname (str): Colorbar label.
+        ColMap (str): Colormap name.
+        smflg, domain, map_limits: As in WRFplotSUB.WRFplot.
+        titles (list of str, optional): Panel titles used to lay out the figure (tight_layout);
+                                        later titles of similar length keep the layout.
+        suptitle_x (float, optional): x position of the figure title. Default is 0.5.
+        incremental_layout (bool, optional): Run tight_layout after each panel is added rather than once,
+                                             which lets the colorbars of tall layouts (3x2) settle. Default is False.
+
+    Attributes:
+        fig (matplotlib.figure.Figure): The figure.
+        axes (list of GeoAxes): The panels, row by row.
+        meshes (list of QuadMesh): The mesh of each panel.
+    """
+
+    def __init__(self, nrows, ncols, lats, lons, vmin, vmax, varname, ColMap, smflg=1, domain='auto',
+                 map_limits=[0, 0, 0, 0], titles=None, suptitle_x=0.5, incremental_layout=False):
+        from matplotlib.figure import Figure
+        from basemap import wrf_projection
+        from WRFplotSUB import WRFplot
+
+        self.fig = Figure()
+        self.axes = list(self.fig.subplots(nrows, ncols, squeeze=False,
+                                           subplot_kw={'projection': wrf_projection()}).flat)
+        self.vmin, self.vmax = vmin, vmax
+        self.suptitle_x = suptitle_x
+
+        lats, lons = np.asarray(lats), np.asarray(lons)
+        empty = np.full(lats.shape, np.nan)
+        titles = titles or [''] * len(self.axes)
+        self.meshes = []
+        for ax, title in zip(self.axes, titles):
+            self.meshes.append(WRFplot(ax, empty, lats, lons, vmin, vmax, title, varname, ColMap,
+                                       smflg=smflg, domain=domain, map_limits=map_limits))
+            if incremental_layout:
+                self.fig.tight_layout()
+        if not incremental_layout:
+            self.fig.tight_layout()
+
+    @profiled('MapTemplate.update')
+    def update(self, panels, suptitle=None):
+        """
+        Set the data and title of the panels.
+
+        Parameters:
+            panels (list of tuple): (title, data) for each panel, row by row; data is 2-D on the grid.
+            suptitle (str, optional): Figure title.
+        """
+        for ax, mesh, (title, data) in zip(self.axes, self.meshes, panels):
+            data = np.ma.masked_invalid(np.asarray(data))
+            mesh.set_array(data)
+            if self.vmin == -999 or self.vmax == -999:
+                mesh.set_clim(data.min() if self.vmin == -999 else self.vmin,
+                              data.max() if self.vmax == -999 else self.vmax)
+            ax.set_title(title, fontsize=10)
+        if suptitle is not None:
+            self.fig.suptitle(suptitle, x=self.suptitle_x)
+
+    def save(self, filename, dpi=300):
+        """Save the figure as the batch scripts do (bbox_inches='tight')."""
+        from profiling import stage
+
+        with stage('savefig', filename=filename):
+            self.fig.savefig(filename, dpi=dpi, bbox_inches='tight')
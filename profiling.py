@@ -0,0 +1,295 @@
+"""
+profiling.py
+
+Optional timing and memory instrumentation of the analysis pipeline (loading, the wind
+statistics and the map plotting), off unless enabled.
+
+Each stage records its wall time, the bytes the process read meanwhile (rchar of
+/proc/self/io, i.e. NetCDF and shapefile reads; None where unavailable) and its peak
+allocation above the allocation at its start (tracemalloc, which also sees numpy arrays).
+Stages nest: a stage's peak includes the peaks of the stages inside it.
+
+tracemalloc hooks every allocation and is not cheap: with it, allquad.py takes 34.5 s against
+14.2 s unprofiled, and the stage times are inflated as much. Profile with memory=False
+(HWW_PROFILE_MEMORY=0 for a whole run) to record only the times and bytes read (14.5 s).
+
+Enable it for a whole run with the HWW_PROFILE environment variable; the per-stage
+breakdown is printed on stderr at exit and, for a file name, also written to that file:
+    HWW_PROFILE=1 python windstuff.py                # breakdown only
+    HWW_PROFILE=trace.json python allmodel.py        # Chrome trace (chrome://tracing, ui.perfetto.dev)
+    HWW_PROFILE=stages.jsonl python windstuff.py     # structured log, one JSON record per stage
+    HWW_PROFILE=1 HWW_PROFILE_MEMORY=0 python allquad.py   # times only, without tracemalloc
+
+or for a block of code with the profile context manager:
+    with profiling.profile('trace.json') as prof:
+        ds = Wwnd.get_wrf850UVT(path, mask_range=MASK_RANGE)
+        Wwnd.avg_from_wind(ds, WIND_DIR, WIND_LABELS, stat=50)
+    print(prof.summary())
+
+Functions:
+    - stage(name, **args):
+        Context manager recording a stage (args are stored with the record).
+    - profiled(name):
+        Decorator recording each call of a function as a stage.
+    - profile(path=None, memory=True):
+        Context manager enabling the instrumentation for a block; yields a Profile.
+    - enable(memory=True), disable(), enabled():
+        Switch the instrumentation on/off.
+
+Stages recorded in batchplot workers are sent back with the results, so a trace of a batch
+run shows one row per worker process.
+"""
+import atexit
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+# Environment variable enabling the instrumentation for the whole run
+ENV_VAR = 'HWW_PROFILE'
+
+# Environment variable switching the memory tracing of that run off ('0', 'false' or 'no')
+MEMORY_ENV_VAR = 'HWW_PROFILE_MEMORY'
+
+_state = {'enabled': False, 'memory': False, 'started_tracemalloc': False}
+
+# Records of the finished stages, in order of completion
+_records = []
+
+# Memory frames of the open stages: [allocation at start, peak so far]
+_stack = []
+
+
+def enabled():
+    """True if the stages are being recorded."""
+    return _state['enabled']
+
+
+def enable(memory=True):
+    """Start recording stages; memory=True also traces allocations (tracemalloc)."""
+    import tracemalloc
+
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _state['started_tracemalloc'] = True
+    _state['enabled'] = True
+    _state['memory'] = memory
+
+
+def disable():
+    """Stop recording stages (the records are kept)."""
+    import tracemalloc
+
+    if _state['started_tracemalloc']:
+        tracemalloc.stop()
+        _state['started_tracemalloc'] = False
+    _state['enabled'] = False
+    _state['memory'] = False
+
+
+def _bytes_read():
+    """Bytes read by the process so far, or None if the platform does not report it."""
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+@contextlib.contextmanager
+def stage(name, **args):
+    """
+    Record the enclosed code as the stage name (a no-op when the instrumentation is off, and in
+    threads other than the main one, e.g. the file openers of get_wrf850UVT: the stages nest per process).
+    """
+    if not _state['enabled'] or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    import tracemalloc
+
+    memory = _state['memory'] and tracemalloc.is_tracing()
+    if memory:
+        current, peak = tracemalloc.get_traced_memory()
+        if _stack:
+            _stack[-1][1] = max(_stack[-1][1], peak)
+        tracemalloc.reset_peak()
+        frame = [current, current]
+    else:
+        frame = [0, 0]
+    _stack.append(frame)
+
+    start = time.time()
+    read0 = _bytes_read()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - t0
+        read1 = _bytes_read()
+        _stack.pop()
+        peak_alloc = None
+        if memory:
+            frame[1] = max(frame[1], tracemalloc.get_traced_memory()[1])
+            peak_alloc = frame[1] - frame[0]
+            if _stack:
+                _stack[-1][1] = max(_stack[-1][1], frame[1])
+            tracemalloc.reset_peak()
+        _records.append({
+            'name': name,
+            'start': start,
+            'wall': wall,
+            'bytes_read': None if read0 is None or read1 is None else read1 - read0,
+            'peak_alloc': peak_alloc,
+            'depth': len(_stack),
+            'pid': os.getpid(),
+            'args': args,
+        })
+
+
+def profiled(name):
+    """Decorator recording each call of the function as the stage name."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _state['enabled']:
+                return func(*args, **kwargs)
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def take_records():
+    """Remove and return the records so far (used to send the records of a worker process back)."""
+    records = _records[:]
+    del _records[:]
+    return records
+
+
+def add_records(records):
+    """Add records taken in another process."""
+    _records.extend(records)
+
+
+def summary(records):
+    """Per-stage breakdown of records, as a text table (stages sorted by total wall time)."""
+    stages = {}
+    for r in records:
+        s = stages.setdefault(r['name'], {'calls': 0, 'wall': 0., 'bytes_read': None, 'peak_alloc': None})
+        s['calls'] += 1
+        s['wall'] += r['wall']
+        if r['bytes_read'] is not None:
+            s['bytes_read'] = (s['bytes_read'] or 0) + r['bytes_read']
+        if r['peak_alloc'] is not None:
+            s['peak_alloc'] = max(s['peak_alloc'] or 0, r['peak_alloc'])
+
+    def mb(n):
+        return '-' if n is None else f'{n / 2 ** 20:.1f}'
+
+    lines = [f'{"stage":<28} {"calls":>6} {"wall [s]":>9} {"per call":>9} {"read [MB]":>10} {"peak [MB]":>10}']
+    for name, s in sorted(stages.items(), key=lambda item: -item[1]['wall']):
+        lines.append(f'{name:<28} {s["calls"]:>6} {s["wall"]:>9.3f} {s["wall"] / s["calls"]:>9.3f} '
+                     f'{mb(s["bytes_read"]):>10} {mb(s["peak_alloc"]):>10}')
+    return '\n'.join(lines)
+
+
+def write_trace(path, records):
+    """Write records as a Chrome trace (Trace Event Format, complete events)."""
+    events = [{
+        'name': r['name'],
+        'cat': 'hww',
+        'ph': 'X',
+        'ts': r['start'] * 1e6,
+        'dur': r['wall'] * 1e6,
+        'pid': r['pid'],
+        'tid': r['pid'],
+        'args': dict(r['args'], bytes_read=r['bytes_read'], peak_alloc=r['peak_alloc']),
+    } for r in records]
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=str)
+
+
+def write_log(path, records):
+    """Write records as a structured log: one JSON object per line."""
+    with open(path, 'w') as f:
+        for r in records:
+            f.write(json.dumps(r, default=str) + '\n')
+
+
+def _write(path, records):
+    """Write records to path: a structured log for '.jsonl' files, else a Chrome trace."""
+    if path.endswith('.jsonl'):
+        write_log(path, records)
+    else:
+        write_trace(path, records)
+
+
+class Profile:
+    """
+    Records of a profile() block.
+
+    Attributes:
+        records (list of dict): One record per stage (name, start, wall, bytes_read, peak_alloc,
+                                depth, pid, args), available once the block has exited.
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def summary(self):
+        """Per-stage breakdown (see summary)."""
+        return summary(self.records)
+
+    def write_trace(self, path):
+        """Write the records as a Chrome trace."""
+        write_trace(path, self.records)
+
+
+@contextlib.contextmanager
+def profile(path=None, memory=True):
+    """
+    Record the stages run in the block.
+
+    Parameters:
+        path (str, optional): File to write the records to at the end of the block: a Chrome trace,
+                              or a structured log if it ends with '.jsonl'. Default is None.
+        memory (bool, optional): Trace the peak allocation of the stages. Default is True.
+
+    Yields:
+        Profile: Holds the records once the block has exited.
+    """
+    previous = dict(_state)
+    first = len(_records)
+    if not previous['enabled'] or (memory and not previous['memory']):
+        enable(memory)
+    prof = Profile()
+    try:
+        yield prof
+    finally:
+        prof.records = _records[first:]
+        if not previous['enabled']:
+            disable()
+            del _records[first:]
+        if path:
+            _write(path, prof.records)
+
+
+def _report_at_exit(target):
+    if os.getpid() != _state.get('pid'):
+        return  # forked worker process
+    print(summary(_records), file=sys.stderr)
+    if target.lower() not in ('1', 'true', 'yes'):
+        _write(target, _records)
+
+
+if os.environ.get(ENV_VAR, '').lower() not in ('', '0', 'false', 'no'):
+    enable(memory=os.environ.get(MEMORY_ENV_VAR, '').lower() not in ('0', 'false', 'no'))
+    _state['pid'] = os.getpid()
+    atexit.register(_report_at_exit, os.environ[ENV_VAR])
@@ -0,0 +1,149 @@
+"""
+raw_cache.py
+
+Memory-mapped raw-array cache of the WRF 850 hPa inputs.
+
+convert() turns a WRF file, after the get_wrf850UVT spatial crop, into a directory of
+uncompressed .npy arrays (one per variable and coordinate) with a meta.json sidecar
+holding the dimensions, attributes and the identity of the source file. get_wrf850UVT
+opens that directory instead of the NetCDF file when it is present and fresh (same
+source size and modification time, same mask_range): the arrays are memory mapped, so
+loads skip the HDF5 decompression and are served from the page cache on reruns.
+
+Functions:
+    - convert(path, mask_range=[-999, 0, 0, 0], cache_dir=None):
+        Writes the cache entry of a WRF file and crop; returns its directory.
+    - open_cached(path, mask_range=[-999, 0, 0, 0], cache_dir=None):
+        The cached dataset (memory-mapped, read-only), or None if there is no fresh entry.
+    - entry_dir(path, mask_range=[-999, 0, 0, 0], cache_dir=None):
+        Directory of the entry of a WRF file and crop.
+
+The cache location can be set with the HWW_RAW_CACHE_DIR environment variable (use a
+local disk). Entries take the uncompressed size of the cropped data.
+
+Example:
+    python raw_cache.py Data/1970wrf850UVT*.nc Data/2070wrf850UVT*.nc   # with ensemble.MASK_RANGE
+"""
+import json
+import os
+
+import numpy as np
+
+# Cache directory
+CACHE_DIR = os.environ.get('HWW_RAW_CACHE_DIR',
+                           os.path.join(os.path.expanduser('~'), '.cache', 'HeatWaveWinds', 'raw'))
+
+# Bump when the layout of the entries changes (2: 0-d variables are stored)
+CACHE_VERSION = 2
+
+# Datetime steps copied at a time by convert
+_COPY_STEPS = 240
+
+
+def _source_ident(path):
+    """Identity of the source file: absolute path, size and modification time."""
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def entry_dir(path, mask_range=[-999, 0, 0, 0], cache_dir=None):
+    """Directory of the cache entry of path cropped to mask_range."""
+    import hashlib
+
+    key = json.dumps([os.path.abspath(path), [float(m) for m in mask_range]])
+    return os.path.join(cache_dir or CACHE_DIR, hashlib.sha256(key.encode()).hexdigest()[:32])
+
+
+def _jsonable(attrs):
+    """Attributes as JSON values (numpy scalars and arrays turned into Python ones)."""
+    return {k: v.tolist() if isinstance(v, (np.ndarray, np.generic)) else v for k, v in attrs.items()}
+
+
+def convert(path, mask_range=[-999, 0, 0, 0], cache_dir=None):
+    """
+    Write the cache entry of the WRF file path cropped to mask_range (as get_wrf850UVT does).
+
+    Parameters:
+        path (str): Path to the WRF 850 hPa NetCDF file.
+        mask_range (list, optional): [lon1, lon2, lat1, lat2] crop, as in get_wrf850UVT. Default is no crop.
+        cache_dir (str, optional): Cache directory. Default is CACHE_DIR.
+
+    Returns:
+        str: The entry directory.
+
+    Raises:
+        ValueError: If a variable cannot be stored as a raw array (e.g. strings).
+    """
+    import shutil
+    from WRF_wind import get_wrf850UVT
+
+    entry = entry_dir(path, mask_range, cache_dir)
+    tmp = f'{entry}.{os.getpid()}.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    ds = get_wrf850UVT(path, mask_range=mask_range, chunks={'datetime': _COPY_STEPS}, raw_cache=False)
+    try:
+        meta = {'version': CACHE_VERSION, 'source': _source_ident(path),
+                'mask_range': [float(m) for m in mask_range], 'attrs': _jsonable(ds.attrs),
+                'coords': {}, 'data_vars': {}}
+        for kind, names in (('coords', list(ds.coords)), ('data_vars', list(ds.data_vars))):
+            for name in names:
+                da = ds[name].variable
+                if da.dtype.kind not in 'biufcmM':
+                    raise ValueError(f"Variable '{name}' of dtype {da.dtype} cannot be cached as a raw array.")
+                out = np.lib.format.open_memmap(os.path.join(tmp, f'{name}.npy'), mode='w+', dtype=da.dtype,
+                                                shape=da.shape)
+                # Copy in datetime blocks, so the data is never all in memory
+                if 'datetime' in da.dims and da.ndim > 1 and da.dims[0] == 'datetime':
+                    for t0 in range(0, da.shape[0], _COPY_STEPS):
+                        out[t0:t0 + _COPY_STEPS] = da[t0:t0 + _COPY_STEPS].values
+                else:
+                    out[...] = da.values
+                out.flush()
+                del out
+                meta[kind][name] = {'dims': list(da.dims), 'attrs': _jsonable(da.attrs)}
+    finally:
+        ds.close()
+
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=1)
+    shutil.rmtree(entry, ignore_errors=True)
+    os.replace(tmp, entry)
+    return entry
+
+
+def open_cached(path, mask_range=[-999, 0, 0, 0], cache_dir=None):
+    """
+    Open the cache entry of path cropped to mask_range.
+
+    Returns:
+        xarray.Dataset or None: The dataset, with read-only memory-mapped arrays, or None if there is
+        no entry or the source file changed since it was written.
+    """
+    import xarray as xr
+
+    entry = entry_dir(path, mask_range, cache_dir)
+    try:
+        with open(os.path.join(entry, 'meta.json')) as f:
+            meta = json.load(f)
+        fresh = meta['version'] == CACHE_VERSION and meta['source'] == _source_ident(path)
+    except (OSError, ValueError, KeyError):
+        return None
+    if not fresh:
+        return None
+
+    def variable(name, info):
+        return xr.Variable(info['dims'], np.load(os.path.join(entry, f'{name}.npy'), mmap_mode='r'), info['attrs'])
+
+    return xr.Dataset({name: variable(name, info) for name, info in meta['data_vars'].items()},
+                      coords={name: variable(name, info) for name, info in meta['coords'].items()},
+                      attrs=meta['attrs'])
+
+
+if __name__ == '__main__':
+    import sys
+    from ensemble import MASK_RANGE
+
+    for source in sys.argv[1:]:
+        print(convert(source, MASK_RANGE))
@@ -0,0 +1,156 @@
+"""
+stats_store.py
+
+Chunked, compressed NetCDF4 store of the wind statistics of the whole ensemble.
+
+The per-member files (Data/T2quad_{period}_{model}.nc) hold one variable per sector
+(T2_all, T2_NE, ...) and are read whole. The store stacks them into one variable per
+statistic with 'model', 'period' and 'sector' dimensions:
+
+    T2(model, period, [wind_min,] sector, south_north, west_east)
+
+chunked so that every map is its own compressed chunk: reading e.g. the NE map of one
+member fetches and decompresses one small chunk, not the file. 'model' and 'period' are
+unlimited dimensions, so members are appended (or overwritten) as their runs finish.
+
+Functions:
+    - write_store(path, stats, model, period, wind_label, compression='zlib', complevel=4):
+        Writes (appends) the statistics of one member to the store, creating it if needed.
+    - open_store(path):
+        Opens the store lazily with xarray.
+    - stack_sectors(stats, wind_label):
+        The statistics of one member with the sector variables stacked along 'sector'.
+
+Example:
+    write_store('Data/T2stats.nc', avg_from_wind(ds, WIND_DIR, WIND_LABELS), 'canesm2', 'hist', WIND_LABELS)
+    with open_store('Data/T2stats.nc') as store:
+        NE = store['T2'].sel(model='canesm2', period='hist', sector='NE').values   # one chunk read
+"""
+import os
+
+import numpy as np
+import xarray as xr
+
+# Default location of the ensemble store
+STORE_PATH = 'Data/T2stats.nc'
+
+
+def stack_sectors(stats, wind_label):
+    """
+    Stack the '<name>_<label>' variables of an avg_from_wind / count_wind_days result (label in
+    'all' + wind_label) into '<name>' variables with a 'sector' dimension, before the grid dimensions.
+
+    The '_all' maps have no wind_min dimension; with a WindMin sweep they are repeated along it
+    (they do not depend on WindMin). Sectors missing for a name are NaN.
+
+    Returns:
+        xarray.Dataset: One variable per statistic, with the XLAT/XLONG coordinates of stats.
+    """
+    sectors = ['all'] + list(wind_label)
+    grouped = {}
+    for key, da in stats.data_vars.items():
+        name, _, label = key.rpartition('_')
+        if name and label in sectors:
+            grouped.setdefault(name, {})[label] = da
+
+    grid = stats.coords['XLAT'].dims
+    out = xr.Dataset(coords={'XLAT': stats.coords['XLAT'], 'XLONG': stats.coords['XLONG']})
+    for name, maps in grouped.items():
+        template = max(maps.values(), key=lambda m: m.ndim)
+        layers = [maps[label].broadcast_like(template) if label in maps
+                  else xr.full_like(template, np.nan, dtype=float) for label in sectors]
+        stacked = xr.concat(layers, dim='sector', coords='minimal', compat='override').assign_coords(sector=sectors)
+        stacked = stacked.transpose(..., 'sector', *grid)
+        stacked.attrs = dict(template.attrs)
+        if 'quantile' in stacked.coords:
+            stacked.attrs['quantile'] = float(stacked['quantile'])
+        scalars = [c for c in stacked.coords if c not in stacked.dims and c not in ('XLAT', 'XLONG')]
+        out[name] = stacked.drop_vars(scalars)
+    return out
+
+
+def _member_index(nc, dim, value):
+    """Index of value along the string dimension dim of the store, appended if new."""
+    names = list(nc.variables[dim][:]) if nc.dimensions[dim].size else []
+    if value in names:
+        return names.index(value)
+    nc.variables[dim][len(names)] = value
+    return len(names)
+
+
+def _create(nc, stacked):
+    """Create the dimensions and coordinates of a new store from the stacked statistics of a member."""
+    nc.createDimension('model', None)
+    nc.createDimension('period', None)
+    for dim in ('model', 'period'):
+        nc.createVariable(dim, str, (dim,))
+    for dim, size in stacked.sizes.items():
+        nc.createDimension(dim, size)
+        if dim in stacked.coords:
+            values = stacked[dim].values
+            var = nc.createVariable(dim, str if values.dtype.kind in 'OU' else values.dtype, (dim,))
+            var[:] = values.astype(object) if values.dtype.kind in 'OU' else values
+    for name in ('XLAT', 'XLONG'):
+        coord = stacked.coords[name]
+        var = nc.createVariable(name, coord.dtype, coord.dims)
+        var.setncatts(coord.attrs)
+        var[:] = coord.values
+    nc.setncattr('Conventions', 'CF-1.8')
+
+
+def _check(nc, stacked):
+    """Raise ValueError unless the statistics have the sectors and grid of the store."""
+    for dim, size in stacked.sizes.items():
+        if dim not in nc.dimensions or nc.dimensions[dim].size != size:
+            raise ValueError(f"The statistics do not match the store along '{dim}'.")
+        if dim in stacked.coords and dim in nc.variables and \
+                not np.array_equal(np.asarray(nc.variables[dim][:]).astype(str), stacked[dim].values.astype(str)):
+            raise ValueError(f"The '{dim}' coordinate of the statistics does not match the store.")
+
+
+def write_store(path, stats, model, period, wind_label, compression='zlib', complevel=4):
+    """
+    Write the statistics of one ensemble member to the store at path (created if missing).
+
+    A member already in the store is overwritten; a new model or period is appended.
+
+    Parameters:
+        path (str): Path of the NetCDF4 store.
+        stats (xarray.Dataset): avg_from_wind / count_wind_days result of the member.
+        model (str): GCM name.
+        period (str): Period name, e.g. 'hist' or 'fut'.
+        wind_label (list of str): Labels of the wind direction ranges, as passed to the statistics.
+        compression (str, optional): netCDF4 compression, e.g. 'zlib' or 'zstd' (if the netCDF library
+                                     has the plugin). Default is 'zlib'.
+        complevel (int, optional): Compression level. Default is 4.
+
+    Raises:
+        ValueError: If the sectors, WindMin values or grid differ from those already in the store.
+    """
+    import netCDF4
+
+    stacked = stack_sectors(stats, wind_label)
+    with netCDF4.Dataset(path, 'a' if os.path.exists(path) else 'w', format='NETCDF4') as nc:
+        if 'model' not in nc.dimensions:
+            _create(nc, stacked)
+        _check(nc, stacked)
+        imodel = _member_index(nc, 'model', str(model))
+        iperiod = _member_index(nc, 'period', str(period))
+
+        for name, da in stacked.data_vars.items():
+            values = da.values
+            if name not in nc.variables:
+                fill = np.nan if values.dtype.kind == 'f' else None
+                # One chunk per map: (model, period, extra dims, sector) of size 1, the whole grid
+                chunks = (1, 1) + (1,) * (da.ndim - 2) + values.shape[-2:]
+                var = nc.createVariable(name, values.dtype, ('model', 'period') + da.dims, fill_value=fill,
+                                        chunksizes=chunks, compression=compression, complevel=complevel,
+                                        shuffle=True)
+                var.setncatts({k: v for k, v in da.attrs.items() if k != '_FillValue'})
+                var.coordinates = 'XLAT XLONG'
+            nc.variables[name][imodel, iperiod] = values
+
+
+def open_store(path=STORE_PATH):
+    """Open the store lazily with xarray: only the chunks of the selected maps are read."""
+    return xr.open_dataset(path, engine='netcdf4')
@@ -0,0 +1,63 @@
+"""
+Tests that the kernel of wind_kernels.py (compiled with numba when it is installed, else run
+as plain Python) and the NumPy engine of WRF_wind give identical sector means and counts.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+import numpy as np
+import pytest
+
+import WRF_wind as Wwnd
+import wind_kernels
+from benchmarks.synthetic import synthetic_wrf, wind_sectors
+
+# name -> (function, keyword arguments)
+CASES = {
+    'mean': ('avg_from_wind', dict()),
+    'mean_windmin': ('avg_from_wind', dict(WindMin=[1, 5])),
+    'mean_hw': ('avg_from_wind', dict(WindMin=1, hw_filt=True)),
+    'wspd': ('avg_from_wind', dict(field='WSPD')),
+    'count': ('count_wind_days', dict(WindMin=[0, 2])),
+    'count_hw': ('count_wind_days', dict(hw_filt=True)),
+}
+
+
+@pytest.fixture(scope='module')
+def ds():
+    """Small synthetic run with NaN samples, calm winds and winds exactly from sector boundaries."""
+    ds = synthetic_wrf(96, 6, 5, seed=1)
+    U, V, T2 = ds['U'].values, ds['V'].values, ds['T2'].values
+    T2[::7, 0, :] = np.nan
+    U[::5, 1, :] = np.nan
+    V[1::5, 1, :] = np.nan
+    U[::3, 2, :], V[::3, 2, :] = 0, 0
+    U[1::3, 2, :], V[1::3, 2, :] = 0, -4        # from 0 (north)
+    U[2::3, 2, :], V[2::3, 2, :] = 0, 4         # from 180
+    U[::3, 3, :], V[::3, 3, :] = -4, 0          # from 90
+    U[1::3, 3, :], V[1::3, 3, :] = 4, 0         # from 270
+    U[::2, 4, :], V[::2, 4, :] = 3, 3           # from 225
+    U[1::2, 4, :], V[1::2, 4, :] = -3, -3       # from 45
+    return ds
+
+
+@pytest.fixture
+def kernel(monkeypatch):
+    """Use the kernel for backend='numba': compiled if numba is installed, else the plain-Python version."""
+    if not wind_kernels.available():
+        monkeypatch.setattr(wind_kernels, 'available', lambda: True)
+    return wind_kernels.sector_sums
+
+
+@pytest.mark.parametrize('sectors', [8, 16])
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+@pytest.mark.parametrize('case', CASES)
+def test_backends_identical(ds, kernel, case, dtype, sectors):
+    func, kwargs = CASES[case]
+    wind_dir, wind_label = wind_sectors(sectors)
+    data = ds.astype(dtype)
+    expected = getattr(Wwnd, func)(data, wind_dir, wind_label, backend='numpy', **kwargs)
+    result = getattr(Wwnd, func)(data, wind_dir, wind_label, backend='numba', **kwargs)
+    assert list(result.data_vars) == list(expected.data_vars)
+    for name in expected.data_vars:
+        np.testing.assert_array_equal(result[name].values, expected[name].values, err_msg=name)
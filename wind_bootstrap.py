@@ -0,0 +1,281 @@
+"""
+wind_bootstrap.py
+
+Significance of the future - historical change of the sector mean anomalies (T2_<label> - T2_all
+of avg_from_wind with stat='mean'), by resampling the datetime steps of the two runs.
+
+Only means are tested. The T2quad files and the 'diff' maps of anomalies.py are sector medians
+(ensemble.py runs stat=50), so these p-values do not apply to them: pair them with the change
+returned here ('<field>_<label>'), or with maps computed with stat='mean' (e.g.
+write_members(run_ensemble(kind='temp', WindMin=1, stat='mean'), prefix='T2mean')).
+
+The samples are assigned to sectors once per run. Every resample is then a vector of
+weights over the datetime steps, and the resampled sector sums and counts of a block of grid
+cells are one matrix product of the resample weights with the (datetime, sector x cell)
+matrix of the samples: all the resamples, sectors and cells of a block at once, with no
+Python loop over resamples. Cell blocks are spread over a process pool, and every worker
+draws the same weights from the seed, so all cells see the same resamples (the spatial
+correlation of the samples is kept).
+
+    - method='bootstrap': each run's datetime steps are resampled with replacement (Poisson
+      bootstrap: independent Poisson(1) weights per step). Returns percentile confidence
+      bounds of the change and the two-sided bootstrap p-value of a zero change.
+    - method='permutation': the datetime steps of the two runs are pooled and relabelled at
+      random (same run lengths). Returns the two-sided permutation p-value.
+
+The sums are computed in float32 on values centred on the historical mean of each cell, so
+the resampled changes are within about 1e-5 K of a float64 computation on the same samples.
+The float32 outputs of avg_from_wind are themselves rounded to float32 (3e-5 K at 290 K): their
+anomaly change differs from the one here by up to about 5e-5 K. The heat wave threshold
+is held fixed over the resamples. Steps are resampled independently, which ignores the
+autocorrelation of the 3-hourly series: the bounds are too narrow (the p-values too small)
+for strongly persistent samples; thin the data (e.g. one step a day) to be conservative.
+
+Functions:
+    - sector_change_test(ds_hist, ds_fut, wind_dir, wind_label, WindMin=0, field='T2', n_resamples=1000,
+                         method='bootstrap', alpha=0.05, anomaly=True, hw_filt=False, hw_pct=95, hw_threshold=None,
+                         seed=None, processes=None, block_size=None):
+        The change of the sector statistics and its p-values (and confidence bounds).
+
+Example:
+    hist = get_wrf850UVT('Data/1970wrf850UVTcanesm2.nc', mask_range=MASK_RANGE)
+    fut = get_wrf850UVT('Data/2070wrf850UVTcanesm2.nc', mask_range=MASK_RANGE)
+    sig = sector_change_test(hist, fut, WIND_DIR, WIND_LABELS, WindMin=1, seed=1)
+    sig['T2_NE'].where(sig['T2_NE_p'] < 0.05)   # significant changes of the NE anomaly
+
+    python wind_bootstrap.py   # every model, written to Data/T2sig_{model}.nc
+"""
+import os
+import warnings
+
+import numpy as np
+import xarray as xr
+
+import WRF_wind as Wwnd
+from profiling import profiled
+
+# Elements of the (datetime, sector x cell) sample matrix of one task
+_TASK_ELEMENTS = 2 ** 24
+
+# Resample weights of a worker process: (historical, future), each (n_resamples, datetime)
+_weights = {}
+
+
+def _init_worker(entropy, method, n_resamples, nt_hist, nt_fut):
+    """Draw the resample weights from the seed (the same in every worker)."""
+    rng = np.random.default_rng(np.random.SeedSequence(entropy))
+    if method == 'bootstrap':
+        hist = rng.poisson(1.0, (n_resamples, nt_hist)).astype(np.float32)
+        fut = rng.poisson(1.0, (n_resamples, nt_fut)).astype(np.float32)
+    else:
+        # Future membership of the pooled steps: random permutations of the run labels
+        labels = np.zeros((n_resamples, nt_hist + nt_fut), dtype=np.float32)
+        labels[:, nt_hist:] = 1
+        labels = rng.permuted(labels, axis=1)
+        hist, fut = labels[:, :nt_hist], labels[:, nt_hist:]
+    _weights['method'] = method
+    _weights['hist'], _weights['fut'] = np.ascontiguousarray(hist), np.ascontiguousarray(fut)
+
+
+def _run_samples(ds, wind_dir, field, WindMin, hw_threshold, block_size):
+    """
+    The samples of one run as (datetime, grid cell) arrays: the field (NaN where not usable) and the
+    sector index of each layer of wind_dir (wind_dir.shape[0] for no sector, WindMin not passed or
+    no usable field).
+    """
+    nsec = wind_dir.shape[0]
+    layers = Wwnd._sector_layers(wind_dir)
+    nt = ds.sizes['datetime']
+    ncell = ds['U'].size // max(nt, 1)
+    values = np.empty((nt, ncell), dtype=np.float32)
+    index = np.empty((len(layers), nt, ncell), dtype=Wwnd._index_dtype(nsec))
+
+    t0 = 0
+    for sel in Wwnd._time_blocks(ds, block_size):
+        block, valid, speed, sectors = Wwnd._block_samples(ds, sel, field, hw_threshold, wind_dir)
+        t1 = t0 + block.shape[0]
+        values[t0:t1] = np.where(valid, block, np.nan)
+        if WindMin > 0:
+            valid &= speed > WindMin
+        for layer, sector in enumerate(sectors):
+            index[layer, t0:t1] = np.where(valid, sector, nsec)
+        t0 = t1
+    return values, index
+
+
+def _sample_matrix(values, index, nsec, offset):
+    """
+    (datetime, 2 * (nsec + 1) * cells) matrix of the samples of a block of cells: the centred field
+    in each sector and over all directions, then the sample indicators of the same, so that a
+    weighted sum over datetime gives every sector sum and count.
+    """
+    valid = ~np.isnan(values)
+    x = np.where(valid, values - offset, 0).astype(np.float32)
+    nt, ncell = values.shape
+    Y = np.zeros((nt, 2, nsec + 1, ncell), dtype=np.float32)
+    for layer in index:
+        for s in np.unique(layer[layer < nsec]):
+            hit = layer == s
+            Y[:, 0, s] = np.where(hit, x, 0)
+            Y[:, 1, s] = hit
+    Y[:, 0, nsec] = x
+    Y[:, 1, nsec] = valid
+    return Y.reshape(nt, -1)
+
+
+def _change(hist, fut, nsec, anomaly):
+    """Future - historical change of the means from sums (..., 2, nsec + 1, cells)."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_hist, mean_fut = hist[..., 0, :, :] / hist[..., 1, :, :], fut[..., 0, :, :] / fut[..., 1, :, :]
+    if not anomaly:
+        return mean_fut - mean_hist
+    return (mean_fut[..., :nsec, :] - mean_fut[..., nsec:, :]) - (mean_hist[..., :nsec, :] - mean_hist[..., nsec:, :])
+
+
+def _test_block(hist, fut, offset, nsec, anomaly, alpha):
+    """
+    Observed change, p-value and (bootstrap) confidence bounds of a block of cells.
+
+    hist and fut are (values, index) of the cells from _run_samples; the weights are those drawn by _init_worker.
+    """
+    Y_hist = _sample_matrix(*hist, nsec, offset)
+    Y_fut = _sample_matrix(*fut, nsec, offset)
+    shape = (2, nsec + 1, offset.size)
+    total_hist = Y_hist.sum(axis=0, dtype=np.float64)
+    total_fut = Y_fut.sum(axis=0, dtype=np.float64)
+    observed = _change(total_hist.reshape(shape), total_fut.reshape(shape), nsec, anomaly)
+
+    W_hist, W_fut = _weights['hist'], _weights['fut']
+    if _weights['method'] == 'bootstrap':
+        resampled_hist, resampled_fut = W_hist @ Y_hist, W_fut @ Y_fut
+    else:
+        # The relabelled future run, and the historical run as the rest of the pooled steps
+        resampled_fut = W_hist @ Y_hist + W_fut @ Y_fut
+        resampled_hist = (total_hist + total_fut).astype(np.float32) - resampled_fut
+    change = _change(resampled_hist.reshape((-1,) + shape), resampled_fut.reshape((-1,) + shape), nsec, anomaly)
+
+    n = np.count_nonzero(~np.isnan(change), axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if _weights['method'] == 'bootstrap':
+            tail = np.minimum(np.count_nonzero(change <= 0, axis=0), np.count_nonzero(change >= 0, axis=0))
+            p = np.minimum(1, 2 * (tail + 1) / (n + 1))
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)  # cells without samples in a sector
+                bounds = np.nanquantile(change, [alpha / 2, 1 - alpha / 2], axis=0)
+        else:
+            # Relative tolerance for the float32 rounding of resamples equal to the observed labelling
+            extreme = np.abs(change) >= np.abs(observed) * (1 - 1e-5)
+            p = (1 + np.count_nonzero(extreme, axis=0)) / (1 + n)
+            bounds = None
+    p = np.where((n > 0) & ~np.isnan(observed), p, np.nan)
+    return observed, p, bounds
+
+
+def _cell_blocks(ncell, nt, ncol):
+    """Slices of the grid cells of the tasks, of about _TASK_ELEMENTS sample matrix elements each."""
+    step = max(1, _TASK_ELEMENTS // max(nt * ncol, 1))
+    return [slice(c0, c0 + step) for c0 in range(0, ncell, step)]
+
+
+@profiled('sector_change_test')
+def sector_change_test(ds_hist, ds_fut, wind_dir, wind_label, WindMin=0, field='T2', n_resamples=1000,
+                       method='bootstrap', alpha=0.05, anomaly=True, hw_filt=False, hw_pct=95, hw_threshold=None,
+                       seed=None, processes=None, block_size=None):
+    """
+    Future - historical change of the sector mean anomalies and its significance, for every grid cell.
+
+    Parameters:
+        ds_hist, ds_fut (xarray.Dataset): Historical and future runs on the same grid, with 'U', 'V' and the field.
+        wind_dir, wind_label: Wind direction ranges and labels, as in WRF_wind.avg_from_wind.
+        WindMin (float, optional): Minimum wind speed of the sector samples. Default is 0.
+        field (str, optional): Field of the statistics. Default is 'T2'.
+        n_resamples (int, optional): Number of resamples. Default is 1000.
+        method (str, optional): 'bootstrap' or 'permutation' (see the module notes). Default is 'bootstrap'.
+        alpha (float, optional): The confidence bounds are the alpha/2 and 1 - alpha/2 percentiles of the
+                                 bootstrap changes. Default is 0.05.
+        anomaly (bool, optional): Test the change of the mean anomaly T2_<label> - T2_all (the 'diff' maps of
+                                  anomalies.py are medians: see the module notes). If False, test the change of
+                                  the means T2_<label> and T2_all themselves. Default is True.
+        hw_filt, hw_pct (optional): Heat wave filter, as in avg_from_wind (each run with its own threshold).
+        hw_threshold (xarray.DataArray, optional): Heat wave threshold of both runs, e.g. heatwave_threshold(ds_hist).
+        seed (int, optional): Seed of the resamples. Default is None (fresh entropy, stored in the 'seed' attribute).
+        processes (int, optional): Worker processes. Default is the CPU count; 1 runs in this process.
+        block_size (int, optional): Datetime steps read at a time while assigning the samples to sectors.
+
+    Returns:
+        xarray.Dataset: '<field>_<label>' (the change), '<field>_<label>_p' (p-value) and, for the bootstrap,
+        '<field>_<label>_lo' and '<field>_<label>_hi' (confidence bounds) for every sector, and the same for
+        '<field>_all' if anomaly is False. NaN where a run has no sample of the sector.
+
+    Raises:
+        ValueError: For an unknown method, a WindMin list, or runs on different grids.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    if method not in ('bootstrap', 'permutation'):
+        raise ValueError("Please set 'method' to 'bootstrap' or 'permutation'.")
+    if np.ndim(WindMin) != 0:
+        raise ValueError("Please set 'WindMin' to a single number.")
+    if field not in ds_hist and field != 'WSPD':
+        raise ValueError(f"Field '{field}' not found in dataset.")
+    grid = ds_hist['U'].transpose('datetime', ...).shape[1:]
+    if ds_fut['U'].transpose('datetime', ...).shape[1:] != grid:
+        raise ValueError("The historical and future runs are not on the same grid.")
+
+    wind_dir = Wwnd._sectors(wind_dir)
+    nsec = wind_dir.shape[0]
+    runs = []
+    for ds in (ds_hist, ds_fut):
+        threshold = Wwnd._heatwave_mask_threshold(ds, hw_filt, hw_pct, hw_threshold, block_size)
+        runs.append(_run_samples(ds, wind_dir, field, WindMin, threshold, block_size))
+    (values_hist, index_hist), (values_fut, index_fut) = runs
+    nt_hist, ncell = values_hist.shape
+    nt_fut = values_fut.shape[0]
+
+    # Centre every cell on its historical mean, for the float32 sums
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        offset = np.nan_to_num(np.nanmean(values_hist, axis=0)).astype(np.float32)
+
+    entropy = np.random.SeedSequence(seed).entropy
+    init = (entropy, method, n_resamples, nt_hist, nt_fut)
+    blocks = _cell_blocks(ncell, max(nt_hist, nt_fut), 2 * (nsec + 1))
+    tasks = [((values_hist[:, c], index_hist[:, :, c]), (values_fut[:, c], index_fut[:, :, c]), offset[c],
+              nsec, anomaly, alpha) for c in blocks]
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes <= 1 or len(tasks) == 1:
+        _init_worker(*init)
+        results = [_test_block(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(processes, len(tasks)), initializer=_init_worker,
+                                 initargs=init) as pool:
+            results = list(pool.map(_test_block, *zip(*tasks)))
+
+    observed = np.concatenate([r[0] for r in results], axis=-1)
+    p = np.concatenate([r[1] for r in results], axis=-1)
+    names = [f'{field}_{label}' for label in wind_label] + ([] if anomaly else [f'{field}_all'])
+    fields = {'': observed, '_p': p}
+    if method == 'bootstrap':
+        bounds = np.concatenate([r[2] for r in results], axis=-1)
+        fields.update({'_lo': bounds[0], '_hi': bounds[1]})
+
+    ds_out = xr.Dataset(coords={'XLAT': ds_hist.coords['XLAT'], 'XLONG': ds_hist.coords['XLONG']},
+                        attrs={'method': method, 'n_resamples': n_resamples, 'alpha': alpha, 'seed': str(entropy),
+                               'anomaly': int(anomaly), 'WindMin': float(WindMin)})
+    for i, name in enumerate(names):
+        for suffix, data in fields.items():
+            ds_out[name + suffix] = Wwnd._to_map(ds_hist, field, data[i])
+    return ds_out
+
+
+if __name__ == '__main__':
+    from ensemble import MODELS, PERIODS, MASK_RANGE, WIND_DIR, WIND_LABELS
+
+    for model in MODELS:
+        hist = Wwnd.get_wrf850UVT(os.path.join('Data', PERIODS['hist'].format(model=model)), mask_range=MASK_RANGE)
+        fut = Wwnd.get_wrf850UVT(os.path.join('Data', PERIODS['fut'].format(model=model)), mask_range=MASK_RANGE)
+        sig = sector_change_test(hist, fut, WIND_DIR, WIND_LABELS, WindMin=1, seed=1)
+        sig.to_netcdf(f'Data/T2sig_{model}.nc')
+        print(model, {label: float((sig[f'T2_{label}_p'] < 0.05).mean()) for label in WIND_LABELS})
@@ -0,0 +1,166 @@
+"""
+wind_cache.py
+
+Persistent on-disk cache of wind statistics (the Datasets returned by avg_from_wind /
+count_wind_days), keyed by the identity of the source WRF file and all the parameters.
+
+An entry is a NetCDF file named after a SHA-256 of the source file path, size and
+modification time, the function and its parameters. Entries are touched on every hit
+and the least recently used ones are removed when the cache grows over its size limit.
+
+Functions:
+    - cached(func, path, **params):
+        Returns func(path, **params), from the cache if the same call was made before.
+    - cache_key(func, path, depends=(), **params):
+        The key of a call.
+    - evict(cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+        Removes least recently used entries until the cache fits in max_bytes.
+
+The cache location and size can be set with the HWW_CACHE_DIR and HWW_CACHE_BYTES
+environment variables.
+"""
+import os
+
+# Cache directory and size limit
+CACHE_DIR = os.environ.get('HWW_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'HeatWaveWinds'))
+MAX_BYTES = int(os.environ.get('HWW_CACHE_BYTES', 2 * 1024 ** 3))
+
+# Bump to invalidate every entry when the statistics change
+CACHE_VERSION = 2
+
+
+def _normalize(value):
+    """Turn numpy arrays/scalars and tuples into plain JSON values, and DataArrays into digests."""
+    import hashlib
+    import numpy as np
+
+    if hasattr(value, 'dims') and hasattr(value, 'values'):
+        # e.g. a precomputed heat wave threshold field
+        data = np.ascontiguousarray(value.values)
+        return {'dims': list(value.dims), 'dtype': str(data.dtype), 'shape': list(data.shape),
+                'sha256': hashlib.sha256(data.tobytes()).hexdigest()}
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    return value
+
+
+def _file_ident(path):
+    """
+    Identity of a file: absolute path, size and modification time. For a glob pattern or a list
+    of files (a run split along datetime), the identities of all the files.
+    """
+    import glob
+
+    if not isinstance(path, (str, os.PathLike)) or glob.has_magic(str(path)):
+        files = sorted(glob.glob(str(path))) if isinstance(path, (str, os.PathLike)) else list(path)
+        return {'files': [_file_ident(f) for f in files]}
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def cache_key(func, path, depends=(), **params):
+    """
+    Key of the call func(path, **params): a SHA-256 of the source file identity (absolute
+    path, size and modification time), of the other files the result depends on, the
+    function name and the parameters.
+    """
+    import hashlib
+    import json
+
+    ident = {
+        'version': CACHE_VERSION,
+        'func': f'{func.__module__}.{func.__qualname__}',
+        **_file_ident(path),
+        'depends': [_file_ident(p) for p in depends],
+        'params': _normalize(params),
+    }
+    return hashlib.sha256(json.dumps(ident, sort_keys=True, default=repr).encode()).hexdigest()
+
+
+def cached(func, path, cache_dir=None, max_bytes=None, depends=(), **params):
+    """
+    Return func(path, **params), reading it from the cache when the source file and the
+    parameters are unchanged, and storing it otherwise.
+
+    Parameters:
+        func (callable): Function of the WRF file path returning an xarray.Dataset.
+        path (str or list of str): Path to the WRF file, a glob pattern or a list of files.
+        cache_dir (str, optional): Cache directory. Default is CACHE_DIR.
+        max_bytes (int, optional): Cache size limit. Default is MAX_BYTES.
+        depends (list of str, optional): Other files read by func (e.g. a heat wave reference run);
+                                         the entry is recomputed when any of them changes.
+        **params: Parameters passed to func.
+
+    Returns:
+        xarray.Dataset: The result, loaded in memory.
+    """
+    import xarray as xr
+
+    cache_dir = cache_dir or CACHE_DIR
+    entry = os.path.join(cache_dir, cache_key(func, path, depends, **params) + '.nc')
+
+    if os.path.exists(entry):
+        try:
+            ds = xr.load_dataset(entry)
+            _touch(entry)
+            return ds
+        except FileNotFoundError:
+            pass  # evicted by another process meanwhile: recompute it
+        except (OSError, ValueError):
+            # Unreadable entry (e.g. interrupted write): recompute it
+            _remove(entry)
+
+    ds = func(path, **params).load()
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f'{entry}.{os.getpid()}.tmp'
+    ds.to_netcdf(tmp)
+    os.replace(tmp, entry)
+    evict(cache_dir, max_bytes)
+    return ds
+
+
+def evict(cache_dir=None, max_bytes=None):
+    """Remove the least recently used cache entries until the cache is at most max_bytes."""
+    cache_dir = cache_dir or CACHE_DIR
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    if not os.path.isdir(cache_dir):
+        return
+
+    # Several processes (e.g. run_ensemble workers) may evict at once: skip the entries already removed
+    entries = []
+    for e in os.scandir(cache_dir):
+        if e.name.endswith('.nc'):
+            try:
+                stat = e.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, e.path))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        total -= size
+        _remove(path)
+
+
+def _touch(path):
+    """Mark a cache entry as used (if another process has not removed it)."""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+def _remove(path):
+    """Remove a cache entry (if another process has not removed it already)."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
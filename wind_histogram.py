@@ -0,0 +1,251 @@
+"""
+wind_histogram.py
+
+Joint wind-rose histogram of the WRF 850 hPa data: per grid cell, the number of samples
+in every direction x speed x field (T2) bin, and the field sums per direction and speed
+bin, built in one pass over the data (streamed in datetime blocks).
+
+The sector statistics of avg_from_wind / count_wind_days are then derived from the
+histogram without reading the WRF files again, for any sectors whose bounds are
+direction bin edges, any WindMin that is a speed bin edge, and any percentile:
+    - counts and means are exact, except for samples exactly on a bin edge (the bins are
+      [lower, upper) while the sectors and WindMin are strict bounds);
+    - percentiles are interpolated within the field bins, so they are within one bin width
+      (field_step) of the exact value.
+Samples need valid U, V and field; '_all' statistics are over the samples with a direction.
+
+Functions:
+    - wind_histogram(ds, dir_bins=16, speed_edges=SPEED_EDGES, field='T2', field_edges=None, field_step=0.5,
+                     hw_filt=False, hw_pct=95, hw_threshold=None, block_size=None):
+        Builds the histogram Dataset ('counts' and 'sums').
+    - histogram_stats(hist, wind_dir, wind_label, WindMin=0, stat='mean'):
+        avg_from_wind (stat 'mean' or a percentile) or count_wind_days (stat 'count') results from a histogram.
+    - write_histogram(hist, path):
+        Saves a histogram as compressed NetCDF (read it back with xarray.load_dataset).
+
+Example:
+    hist = wind_histogram(get_wrf850UVT(path, mask_range=MASK_RANGE))
+    write_histogram(hist, 'Data/hist_hist_canesm2.nc')
+    T2quad = histogram_stats(hist, WIND_DIR, WIND_LABELS, WindMin=1, stat=90)
+"""
+import numpy as np
+import xarray as xr
+
+import WRF_wind as Wwnd
+from profiling import profiled
+
+# Default lower edges of the speed bins (m/s); the last bin is open-ended
+SPEED_EDGES = [0, 1, 2, 3, 4, 5, 7.5, 10, 15, 20]
+
+
+def _edges(values, name):
+    edges = np.asarray(values, dtype=float)
+    if edges.ndim != 1 or edges.size == 0 or np.any(np.diff(edges) <= 0):
+        raise ValueError(f"'{name}' must be a non-empty increasing list of bin edges.")
+    return edges
+
+
+@profiled('wind_histogram')
+def wind_histogram(ds, dir_bins=16, speed_edges=SPEED_EDGES, field='T2', field_edges=None, field_step=0.5,
+                   hw_filt=False, hw_pct=95, hw_threshold=None, block_size=None):
+    """
+    Per-cell joint histogram of wind direction, wind speed and a field, in one pass over the data.
+
+    Parameters:
+        ds (xarray.Dataset): Dataset with 'U', 'V' and the field, with a 'datetime' dimension.
+        dir_bins (int, optional): Number of equal direction bins starting at north. Sector bounds must be
+                                  multiples of 360 / dir_bins (e.g. 16 bins for quadrants and 8-point roses).
+                                  Default is 16.
+        speed_edges (list of float, optional): Lower edges of the speed bins, starting at 0; the last bin is
+                                               open-ended. WindMin values must be edges. Default is SPEED_EDGES.
+        field (str, optional): Field to histogram. Default is 'T2'.
+        field_edges (list of float, optional): Edges of the field bins; values below the first or above the
+                                               last edge fall in two outer bins. Default is None: field_step
+                                               bins over the range of the field (an extra read of the field
+                                               when ds is lazy).
+        field_step (float, optional): Width of the default field bins. Default is 0.5.
+        hw_filt, hw_pct, hw_threshold: Heat wave filter, as in avg_from_wind (applied while building).
+        block_size (int, optional): Datetime steps per block. Default is None (about 4M samples per block).
+
+    Returns:
+        xarray.Dataset: 'counts' (grid, direction, speed, <field>_bin) as uint16 (uint32 for records of 65536
+        steps or more) and 'sums' (grid, direction, speed) float64, with the lower bin edges as coordinates
+        and XLAT/XLONG.
+    """
+    if field not in ds:
+        raise ValueError(f"Field '{field}' not found in dataset.")
+    if not (isinstance(dir_bins, (int, np.integer)) and dir_bins > 0):
+        raise ValueError("Please set 'dir_bins' to a positive integer.")
+    speed_edges = _edges(speed_edges, 'speed_edges')
+    if speed_edges[0] != 0:
+        raise ValueError("'speed_edges' must start at 0.")
+    if field_edges is None:
+        lo, hi = float(ds[field].min()), float(ds[field].max())
+        start = np.floor(lo / field_step) * field_step
+        field_edges = start + field_step * np.arange(int(np.floor((hi - start) / field_step)) + 2)
+    field_edges = _edges(field_edges, 'field_edges')
+
+    hw_threshold = Wwnd._heatwave_mask_threshold(ds, hw_filt, hw_pct, hw_threshold, block_size)
+
+    template = ds['U'].transpose('datetime', ...).isel(datetime=0, drop=True)
+    ncell = template.size
+    cell = np.arange(ncell)
+    nd, ns, nf = dir_bins, speed_edges.size, field_edges.size + 1
+    # A bin cannot get more samples than there are datetime steps
+    counts = np.zeros(ncell * nd * ns * nf, dtype=np.uint16 if ds.sizes['datetime'] < 2 ** 16 else np.uint32)
+    sums = np.zeros(ncell * nd * ns)
+
+    for sel in Wwnd._time_blocks(ds, block_size):
+        u = Wwnd._block_values(ds['U'], sel)
+        v = Wwnd._block_values(ds['V'], sel)
+        values = Wwnd._block_values(ds[field], sel)
+        direction = Wwnd._wind_direction(u, v)
+        valid = ~np.isnan(values) & ~np.isnan(direction)
+        if hw_threshold is not None:
+            T2 = values if field == 'T2' else Wwnd._block_values(ds['T2'], sel)
+            valid &= T2 > Wwnd._block_threshold(hw_threshold, sel)
+
+        values = values[valid]
+        dbin = np.minimum((direction[valid] * (nd / 360)).astype(np.intp), nd - 1)
+        sbin = np.searchsorted(speed_edges, np.hypot(u[valid], v[valid]), side='right') - 1
+        key = (np.broadcast_to(cell, valid.shape)[valid] * nd + dbin) * ns + sbin
+        sums += np.bincount(key, weights=values, minlength=sums.size)
+        np.add.at(counts, key * nf + np.searchsorted(field_edges, values, side='right'), 1)
+
+    dims = template.dims
+    coords = {
+        'XLAT': template.coords['XLAT'],
+        'XLONG': template.coords['XLONG'],
+        'direction': np.arange(nd) * (360 / nd),
+        'speed': speed_edges,
+        f'{field}_bin': np.concatenate([[-np.inf], field_edges]),
+    }
+    hist = xr.Dataset(
+        {
+            'counts': (dims + ('direction', 'speed', f'{field}_bin'), counts.reshape(template.shape + (nd, ns, nf))),
+            'sums': (dims + ('direction', 'speed'), sums.reshape(template.shape + (nd, ns))),
+        },
+        coords=coords,
+        attrs={'field': field, 'hw_filt': int(hw_threshold is not None)},
+    )
+    hist['direction'].attrs['long_name'] = 'Lower edge of the direction bin (degrees, wind from)'
+    hist['speed'].attrs['long_name'] = 'Lower edge of the speed bin (m/s)'
+    hist[f'{field}_bin'].attrs['long_name'] = f'Lower edge of the {field} bin'
+    return hist
+
+
+def _direction_mask(hist, limits):
+    """Direction bins within the sector limits [start, end] (wrapping if start > end)."""
+    nd = hist.sizes['direction']
+    start, end = (np.asarray(limits, dtype=float) * nd / 360)
+    if start != np.round(start) or end != np.round(end):
+        raise ValueError(f"Sector {[float(x) for x in limits]} does not fall on the {360 / nd:g} degree direction bins.")
+    lower = np.arange(nd)
+    if start > end:
+        return (lower >= start) | (lower + 1 <= end)
+    return (lower >= start) & (lower + 1 <= end)
+
+
+def _speed_mask(hist, level):
+    """Speed bins above the WindMin level (every bin for level <= 0)."""
+    edges = hist['speed'].values
+    if level <= 0:
+        return np.ones(edges.size, dtype=bool)
+    if level not in edges:
+        raise ValueError(f"WindMin {level:g} is not one of the speed bin edges {edges.tolist()}.")
+    return edges >= level
+
+
+def _quantile(counts, lower, upper, q):
+    """
+    Quantile q of the samples of each row of counts (cells x field bins), with numpy's 'linear'
+    method on the samples placed evenly within their bins, so within one bin width of the
+    exact value. NaN for empty rows.
+    """
+    cum = np.cumsum(counts, axis=1)
+    n = cum[:, -1]
+    rows = np.arange(counts.shape[0])
+
+    def order_statistic(rank):
+        k = np.minimum((cum <= rank[:, None]).sum(axis=1), counts.shape[1] - 1)
+        inbin = counts[rows, k]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            value = lower[k] + (rank - (cum[rows, k] - inbin) + 0.5) / inbin * (upper[k] - lower[k])
+        # The outer bins are open-ended: use their finite edge
+        return np.where(np.isinf(lower[k]), upper[k], np.where(np.isinf(upper[k]), lower[k], value))
+
+    lo, hi, t = Wwnd._quantile_ranks(np.maximum(n, 1), q)
+    value = Wwnd._interpolate(order_statistic(lo), order_statistic(hi), t)
+    return np.where(n > 0, value, np.nan)
+
+
+def histogram_stats(hist, wind_dir, wind_label, WindMin=0, stat='mean'):
+    """
+    Sector statistics from a wind_histogram, in the layout of avg_from_wind / count_wind_days.
+
+    Parameters:
+        hist (xarray.Dataset): Histogram from wind_histogram.
+        wind_dir (array-like): Wind direction ranges, shape (N, 2), on the direction bin edges.
+        wind_label (list of str): Labels of the ranges.
+        WindMin (float or array-like, optional): Minimum wind speed(s), speed bin edges (or <= 0). Default is 0.
+        stat (str or float, optional): 'mean', a percentile (0-100), or 'count' for the count_wind_days
+                                       result ('wind_days_<label>'). Default is 'mean'.
+
+    Returns:
+        xarray.Dataset: '<field>_<label>' and '<field>_all' (or 'wind_days_<label>'), with a 'wind_min'
+        dimension for a list of WindMin values.
+
+    Raises:
+        ValueError: If a sector bound is not a direction bin edge, a WindMin is not a speed bin edge,
+                    or stat is not valid.
+    """
+    field = hist.attrs['field']
+    if not (stat in ('mean', 'count') or (isinstance(stat, (int, float)) and 0 <= stat <= 100)):
+        raise ValueError("Please set 'stat' to 'mean', 'count' or a float percentile between 0 and 100.")
+
+    wind_dir = np.asarray(wind_dir)
+    grid = hist['sums'].dims[:-2]
+    shape = tuple(hist.sizes[d] for d in grid)
+    counts = hist['counts'].values.reshape((-1,) + hist['counts'].shape[len(grid):])
+    sums = hist['sums'].values.reshape((-1,) + hist['sums'].shape[len(grid):])
+    edges = hist[f'{field}_bin'].values
+    lower, upper = edges, np.append(edges[1:], np.inf)
+    levels = np.atleast_1d(np.asarray(WindMin, dtype=float))
+
+    def to_map(data):
+        return xr.DataArray(np.asarray(data).reshape(shape), dims=grid,
+                            coords={'XLAT': hist.coords['XLAT'], 'XLONG': hist.coords['XLONG']})
+
+    def reduce(dmask, smask):
+        n = counts[:, dmask][:, :, smask]
+        if stat == 'count':
+            return n.sum(axis=(1, 2, 3), dtype=np.int64)
+        if stat == 'mean':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return sums[:, dmask][:, :, smask].sum(axis=(1, 2)) / n.sum(axis=(1, 2, 3), dtype=np.int64)
+        return _quantile(n.sum(axis=(1, 2), dtype=np.int64), lower, upper, stat / 100)
+
+    def maps(dmask):
+        stacked = [to_map(reduce(dmask, _speed_mask(hist, level))) for level in levels]
+        if np.ndim(WindMin) == 0:
+            return stacked[0]
+        return xr.concat(stacked, dim='wind_min').assign_coords(wind_min=levels)
+
+    out = xr.Dataset(coords={'XLAT': hist.coords['XLAT'], 'XLONG': hist.coords['XLONG']})
+    if stat == 'count':
+        for idr, label in enumerate(wind_label):
+            out['wind_days_' + label] = maps(_direction_mask(hist, wind_dir[idr]))
+        return out
+
+    everything = np.ones(hist.sizes['direction'], dtype=bool)
+    out[field + '_all'] = to_map(reduce(everything, np.ones(hist.sizes['speed'], dtype=bool)))
+    for idr, label in enumerate(wind_label):
+        out[field + '_' + label] = maps(_direction_mask(hist, wind_dir[idr]))
+    if stat != 'mean':
+        out = out.assign_coords(quantile=stat / 100)
+    return out
+
+
+def write_histogram(hist, path):
+    """Write a histogram to a NetCDF file with its counts and sums compressed (mostly empty bins)."""
+    hist.to_netcdf(path, encoding={name: {'zlib': True, 'complevel': 4} for name in hist.data_vars})
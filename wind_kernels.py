@@ -0,0 +1,131 @@
+"""
+wind_kernels.py
+
+Compiled (numba) kernel of the sector sums of WRF_wind, used by avg_from_wind (stat='mean')
+and count_wind_days when numba is installed.
+
+The NumPy engine (WRF_wind._sector_sums) assigns the samples of a datetime block to sectors
+with whole-array operations: wind speed, direction, sector index, speed bin, masks and the
+bincount keys each allocate a temporary the size of the block. The kernel fuses all of it
+(the sector is read from the lookup table of WRF_wind.Sectors) into one loop over the samples
+of each grid cell, parallel over the cells (each cell owns its slots of the result, so there
+are no write conflicts), with no temporary beyond the per-cell accumulators.
+
+The results are identical to those of the NumPy engine: the speed and direction are computed
+with the same float operations in the dtype of the data, and the samples of each cell are
+accumulated in the same order (per block, then added to the totals). The one exception is
+arctan2, which NumPy vectorises with its own implementation: it can differ from the libm atan2
+of the kernel in the last bit, so a wind within rounding of a sector boundary (a few samples
+per 10^8) can fall on the other side of it (tests/test_sector_backends.py and
+benchmarks/sector_backends.py check the rest).
+
+numba is optional: without it, available() is False and WRF_wind uses the NumPy engine.
+The kernel also runs uncompiled (slowly) as plain Python: the speed and direction are then
+NumPy scalars in the dtype of the data, and the results are the same (arctan2 aside).
+
+Functions:
+    - available():
+        True if numba is installed.
+    - sector_sums(u, v, values, t2, threshold, mode, hw, table, resolution, levels, group, consts, sums, counts,
+                  all_sums, all_counts):
+        Accumulates the sector sums and counts of one datetime block (see its docstring).
+"""
+import math
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Modes of the kernel: sums of a field, sums of the wind speed ('WSPD'), counts only
+FIELD, SPEED, COUNT = 0, 1, 2
+
+
+def available():
+    """True if numba is installed (the compiled kernel can be used)."""
+    return numba is not None
+
+
+_prange = numba.prange if numba is not None else range
+
+
+def _sector_sums(u, v, values, t2, threshold, mode, hw, table, resolution, levels, group, consts, sums, counts,
+                 all_sums, all_counts):
+    """
+    Add the sector sums and counts of one datetime block to the totals.
+
+    Parameters:
+        u, v (numpy.ndarray): Wind components of the block, (time, cell).
+        values (numpy.ndarray): Field of the block, (time, cell) (any array of that shape unless mode is FIELD).
+        t2 (numpy.ndarray): T2 of the block, (time, cell), for the heat wave mask.
+        threshold (numpy.ndarray): Heat wave threshold per cell, float64.
+        mode (int): FIELD, SPEED or COUNT (samples counted whatever their field).
+        hw (bool): Only use the samples with t2 above threshold.
+        table (numpy.ndarray): Sector lookup table of WRF_wind.Sectors, (layers, entries), nsec for no sector.
+        resolution (float): Table steps per degree (Sectors.resolution).
+        levels (numpy.ndarray): Sorted WindMin levels, float64 (-inf for no threshold).
+        group (numpy.ndarray): Group code of every datetime step of the block, intp.
+        consts (numpy.ndarray): Degrees per radian, 180 and 360 in the dtype of u.
+        sums, counts (numpy.ndarray): Totals (G * (L + 1) * (nsec + 1), cell), float64 and int64, keyed as in
+                                      WRF_wind._sector_sums (group, speed bin, sector).
+        all_sums, all_counts (numpy.ndarray): Totals over all directions (G, cell), float64 and int64.
+    """
+    nt, ncell = u.shape
+    nlev = levels.shape[0]
+    nslot = sums.shape[0]
+    ngroups = all_sums.shape[0]
+    nsec = nslot // (ngroups * (nlev + 1)) - 1
+    nlayers, nan_key = table.shape[0], table.shape[1] - 1
+    for c in _prange(ncell):
+        # Sums of the block, added to the totals at the end as the NumPy engine does
+        block_sums = np.zeros(nslot)
+        block_counts = np.zeros(nslot, dtype=np.int64)
+        block_all_sums = np.zeros(ngroups)
+        block_all_counts = np.zeros(ngroups, dtype=np.int64)
+        for t in range(nt):
+            speed = np.hypot(u[t, c], v[t, c])
+            if mode == FIELD:
+                x = np.float64(values[t, c])
+            elif mode == SPEED:
+                x = np.float64(speed)
+            else:
+                x = 0.0
+            if mode != COUNT and math.isnan(x):
+                continue
+            if hw and not t2[t, c] > threshold[c]:
+                continue
+            g = group[t]
+            if mode != COUNT:
+                block_all_sums[g] += x
+                block_all_counts[g] += 1
+
+            direction = (consts[1] + np.arctan2(u[t, c], v[t, c]) * consts[0]) % consts[2]
+            # Table entry, as Sectors.key: on step k (2k) or strictly between k and k + 1 (2k + 1)
+            if math.isnan(direction):
+                key = nan_key
+            else:
+                scaled = direction * resolution
+                step = math.floor(scaled)
+                key = 2 * step + (1 if scaled > step else 0)
+            # Number of levels the speed is above (NaN speeds only pass the -inf levels)
+            b = 0
+            while b < nlev and (levels[b] < speed or levels[b] == -np.inf):
+                b += 1
+            base = (g * (nlev + 1) + b) * (nsec + 1)
+            for layer in range(nlayers):
+                s = table[layer, key]
+                if s < nsec:
+                    block_sums[base + s] += x
+                    block_counts[base + s] += 1
+
+        for k in range(nslot):
+            sums[k, c] += block_sums[k]
+            counts[k, c] += block_counts[k]
+        for g in range(ngroups):
+            all_sums[g, c] += block_all_sums[g]
+            all_counts[g, c] += block_all_counts[g]
+
+
+sector_sums = numba.njit(parallel=True, cache=True)(_sector_sums) if numba is not None else _sector_sums